@@ -0,0 +1,173 @@
+"""Local multi-process cluster: stateless API nodes and lease-based workers.
+
+Starts --api-nodes uvicorn processes with JOB_EXECUTION=workers and a number
+of worker.py processes, all with the offline fake model backend, sharing one
+SQLite job store and a temporary STORAGE_DIR. Distinct synthetic PDFs are
+uploaded round robin across the API nodes, and each job is followed on a
+different node than the one it was uploaded to. With --kill-worker, the
+first worker and its job subprocesses are killed (SIGKILL) once jobs are
+running, like a crashed worker: its jobs are reclaimed when their leases run
+out and finish on the other workers. Reports jobs/min for each worker count.
+
+    python benchmarks/bench_cluster.py [--workers 1 2 4] [--jobs 16] [--pages 20] [--kill-worker]
+"""
+import os
+import sys
+import time
+import signal
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from bench_pipeline import make_pdf  # noqa: E402
+
+BASE_PORT = 8700
+
+
+def cluster_env(args, workdir):
+    env = dict(os.environ)
+    env.update({
+        "JOB_EXECUTION": "workers",
+        "STORAGE_DIR": workdir,
+        "JOB_STORE": "sqlite:" + os.path.join(workdir, "jobs.db"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "RATE_LIMIT_STORE": os.path.join(workdir, "rate_limits.db"),
+        "REMOTE_FILE_STORE": os.path.join(workdir, "remote_files.db"),
+        "MODEL_BACKEND": "fake",
+        "FAKE_LATENCY_SECONDS": str(args.latency),
+        "LOCAL_PARSER": "0",
+        "GEMINI_MAX_IN_FLIGHT": str(args.in_flight),
+        # No request or token quota, throughput is bounded by the workers alone
+        "GEMINI_RPM": "0",
+        "GEMINI_TPM": "0",
+        "JOB_WORKERS": str(args.slots),
+        "JOB_LEASE_SECONDS": str(args.lease),
+        "JOB_QUEUE_SIZE": str(args.jobs + 1),
+        # Several workers on one host would compete for the same metrics port
+        "WORKER_METRICS_PORT": "0",
+    })
+    return env
+
+
+def start(command, env, log_path):
+    log = open(log_path, "wb")
+    # Own process group: killing it takes the job subprocesses down too
+    return subprocess.Popen(command, cwd=REPOSITORY, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"API node on port {port} didn't start")
+
+
+def stop(processes):
+    for process in processes:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def run_cluster(args, workers):
+    workdir = tempfile.mkdtemp(prefix="bench-cluster-")
+    env = cluster_env(args, workdir)
+    ports = [BASE_PORT + node for node in range(args.api_nodes)]
+    processes = []
+    try:
+        for port in ports:
+            processes.append(start([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                                   env, os.path.join(workdir, f"api-{port}.log")))
+        for port in ports:
+            wait_until_up(port)
+        worker_processes = [
+            start([sys.executable, "worker.py"], env, os.path.join(workdir, f"worker-{number}.log"))
+            for number in range(workers)
+        ]
+        processes.extend(worker_processes)
+
+        started = time.perf_counter()
+        jobs = []
+        for number in range(args.jobs):
+            pdf_path = os.path.join(workdir, f"upload-{number}.pdf")
+            make_pdf(pdf_path, args.pages, label=f"Document {number}")
+            node = ports[number % len(ports)]
+            with open(pdf_path, "rb") as f:
+                response = httpx.post(f"http://127.0.0.1:{node}/upload", data={"customInput": "bench"},
+                                      files={"file": (f"upload-{number}.pdf", f, "application/pdf")}, timeout=60)
+            jobs.append(response.headers["location"].rsplit("/", 1)[-1])
+
+        killed = False
+        finished = {}
+        while len(finished) < len(jobs):
+            if args.kill_worker and not killed and workers > 1 and time.perf_counter() - started > args.kill_after:
+                os.killpg(worker_processes[0].pid, signal.SIGKILL)
+                killed = True
+            for number, uuid in enumerate(jobs):
+                if uuid in finished:
+                    continue
+                # Followed on another node than the one that took the upload
+                node = ports[(number + 1) % len(ports)]
+                state = httpx.get(f"http://127.0.0.1:{node}/metadata/{uuid}/wait", params={"timeout": 0}, timeout=30).json()
+                if state["finished"]:
+                    finished[uuid] = state["job"]["status"]
+            time.sleep(0.5)
+        elapsed = time.perf_counter() - started
+
+        metadata = {job["uuid"]: job for job in httpx.get(f"http://127.0.0.1:{ports[0]}/metadata", timeout=30).json()}
+        return {
+            "workers": workers,
+            "jobs_per_min": len(jobs) / elapsed * 60,
+            "seconds": elapsed,
+            "processed": sum(1 for status in finished.values() if status.startswith("Processed")),
+            "failed": sum(1 for status in finished.values() if not status.startswith("Processed")),
+            "reclaimed": sum(1 for uuid in jobs if metadata[uuid].get("attempts", 1) > 1),
+            "killed": killed,
+        }
+    finally:
+        stop(processes)
+        if args.keep:
+            print(f"Logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker processes, one cluster per count")
+    parser.add_argument("--api-nodes", type=int, default=2)
+    parser.add_argument("--slots", type=int, default=2, help="jobs per worker at the same time (JOB_WORKERS)")
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency per call, seconds")
+    parser.add_argument("--in-flight", type=int, default=0, help="GEMINI_MAX_IN_FLIGHT shared by every worker, 0 for no limit")
+    parser.add_argument("--lease", type=float, default=6, help="JOB_LEASE_SECONDS")
+    parser.add_argument("--kill-worker", action="store_true", help="SIGKILL the first worker while jobs run")
+    parser.add_argument("--kill-after", type=float, default=3, help="seconds after the first upload")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory with the processes' logs")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'jobs/min':>9} {'seconds':>8} {'processed':>9} {'failed':>6} {'reclaimed':>9}")
+    for workers in args.workers:
+        result = run_cluster(args, workers)
+        print(f"{result['workers']:>7} {result['jobs_per_min']:>9.1f} {result['seconds']:>8.1f} {result['processed']:>9} "
+              f"{result['failed']:>6} {result['reclaimed']:>9}" + ("  (one worker killed)" if result["killed"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Micro-benchmark of question deduplication.
+
+Compares the pairwise comparison MCQBatchProcessor used before with the
+MinHash/LSH QuestionIndex on synthetic question banks. Before timing, it
+checks that distinct questions sharing an option set all survive.
+
+    python benchmarks/bench_dedup.py [--sizes 1000 10000 20000] [--duplicates 0.1]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcq_extractor.dedup import QuestionIndex, normalize_question_text
+
+STOP_WORDS = "the of a to in is which following what for and with by on".split()
+
+
+def make_vocabulary(size=5000, seed=3):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+WORDS = make_vocabulary()
+
+
+def pick_word(rng):
+    # Question stems mix a few very common words with topic words
+    return rng.choice(STOP_WORDS) if rng.random() < 0.3 else rng.choice(WORDS)
+
+
+def make_question(rng, number):
+    stem = " ".join(pick_word(rng) for _ in range(rng.randint(12, 30)))
+    return {
+        "SI.No": number,
+        "question": f"<p>{number} {stem}?</p>",
+        "options": [" ".join(pick_word(rng) for _ in range(4)) for _ in range(4)],
+        "correct_answer": rng.choice("ABCD"),
+        "type": "MCQ",
+    }
+
+
+def make_bank(size, duplicate_ratio, seed=7):
+    """Questions with a share of near-duplicates (one word changed, different markup)"""
+    rng = random.Random(seed)
+    questions = [make_question(rng, number) for number in range(1, size + 1)]
+    for _ in range(int(size * duplicate_ratio)):
+        original = rng.choice(questions)
+        words = original["question"][3:-4].split()
+        words[rng.randrange(len(words))] = pick_word(rng)
+        questions.append(dict(original, question="<p> " + " ".join(words) + " </p>"))
+    rng.shuffle(questions)
+    return questions
+
+
+def pairwise_dedup(questions, threshold=0.8):
+    """The former O(n·m) approach, normalising both sides of every pair"""
+    kept = []
+    for new_q in questions:
+        is_duplicate = False
+        for existing_q in kept:
+            words1 = set(normalize_question_text(new_q).split())
+            words2 = set(normalize_question_text(existing_q).split())
+            if words1 and words2 and len(words1 & words2) / len(words1 | words2) >= threshold:
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            kept.append(new_q)
+    return kept
+
+
+def check_shared_options(threshold=0.8):
+    """Distinct questions that reuse one option set must all be kept, a real duplicate must not"""
+    planets = ["Mercury", "Venus", "Jupiter", "Mars"]
+    numbers = ["2", "3", "5", "9"]
+    questions = [
+        {"question": "<p>Which is the largest planet?</p>", "options": planets},
+        {"question": "<p>Which is the smallest planet?</p>", "options": planets},
+        {"question": "<p>Which of these is NOT a prime number?</p>", "options": numbers},
+        {"question": "<p>Which of these is a prime number?</p>", "options": ["4", "6", "7", "9"]},
+        {"question": "<p>Which of these is a prime number?</p>", "options": numbers},
+        {"question": "Which is the largest  planet?", "options": ["mercury", "Venus", "<b>Jupiter</b>", "Mars"]},
+    ]
+    index = QuestionIndex(threshold)
+    kept = [index.add(question) for question in questions]
+    if kept != [True, True, True, True, True, False]:
+        sys.exit(f"Deduplication check failed: kept {kept}")
+    print("Deduplication check passed: distinct questions sharing options are kept")
+
+
+def index_dedup(questions, threshold=0.8):
+    index = QuestionIndex(threshold)
+    return [question for question in questions if index.add(question)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 20000])
+    parser.add_argument("--duplicates", type=float, default=0.1, help="share of near-duplicates added")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--pairwise-limit", type=int, default=2000, help="skip the quadratic baseline above this size")
+    args = parser.parse_args()
+
+    check_shared_options(args.threshold)
+    print(f"{'questions':>10} {'method':>9} {'seconds':>9} {'kept':>7}")
+    for size in args.sizes:
+        questions = make_bank(size, args.duplicates)
+        methods = [("index", index_dedup)]
+        if len(questions) <= args.pairwise_limit:
+            methods.insert(0, ("pairwise", pairwise_dedup))
+        for name, method in methods:
+            started = time.perf_counter()
+            kept = method(questions, args.threshold)
+            elapsed = time.perf_counter() - started
+            print(f"{len(questions):>10} {name:>9} {elapsed:>9.3f} {len(kept):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""End-to-end benchmark of the extraction pipeline, without a Gemini key.
+
+Model calls go to the offline FakeBackend, which replays the results in
+Outputs/ with injected latency, truncation, empty responses and 500 errors.
+Synthetic text-layer PDFs of each size are run through MCQBatchProcessor,
+or with --app through the FastAPI app, its job queue and job subprocesses.
+Each size runs in a fresh process so that its memory peak is its own.
+Processor jobs each start with a cold cache, --app jobs share the server's
+cache, so repeated uploads show the cache-hit path.
+
+    python benchmarks/bench_pipeline.py [--pages 10 100 1000] [--jobs 3] [--truncate 0.05] [--app]
+        [--ladder gemini-2.5-flash,gemini-2.5-pro --model-latency gemini-2.5-flash=0.2,gemini-2.5-pro=1 --invalid 0.1]
+"""
+import os
+import sys
+import time
+import queue
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS_PER_PAGE = 5
+
+
+def make_pdf(path, pages, label=""):
+    """Text-layer PDF with QUESTIONS_PER_PAGE numbered questions per page, label makes its pages unique"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=letter)
+    number = 1
+    for _ in range(pages):
+        y = 740
+        if label:
+            pdf.drawString(40, 760, label)
+        for _ in range(QUESTIONS_PER_PAGE):
+            pdf.drawString(40, y, f"{number}. Which of the following statements about topic {number} is correct?")
+            y -= 16
+            for letter_ in "ABCD":
+                pdf.drawString(60, y, f"({letter_}) Option {letter_} of question {number}")
+                y -= 14
+            y -= 10
+            number += 1
+        pdf.showPage()
+    pdf.save()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def configure(args, workdir):
+    os.environ["MODEL_BACKEND"] = "fake"
+    os.environ["FAKE_LATENCY_SECONDS"] = str(args.latency)
+    os.environ["FAKE_TRUNCATE_RATE"] = str(args.truncate)
+    os.environ["FAKE_EMPTY_RATE"] = str(args.empty)
+    os.environ["FAKE_ERROR_RATE"] = str(args.errors)
+    os.environ["FAKE_INVALID_RATE"] = str(args.invalid)
+    os.environ["FAKE_MODEL_LATENCY"] = args.model_latency
+    os.environ["MODEL_LADDER"] = args.ladder
+    os.environ["BATCH_CONCURRENCY"] = str(args.concurrency)
+    os.environ["LOCAL_PARSER"] = "1" if args.local_parser else "0"
+    os.environ["CACHE_DIR"] = os.path.join(workdir, "cache")
+
+
+def run_processor(args, pdf_path, workdir):
+    """Jobs straight through MCQBatchProcessor, one after another"""
+    from mcq_extractor.backends import FakeBackend
+    from mcq_extractor.batch_processor import MCQBatchProcessor
+    from mcq_extractor.cache import ResultCache
+
+    backend = FakeBackend()
+    durations, questions = [], 0
+    for job in range(args.jobs):
+        # A cold cache per job, otherwise every job after the first is a cache hit
+        cache = ResultCache(os.path.join(workdir, f"cache-{job}"))
+        processor = MCQBatchProcessor("offline", cache=cache, backend=backend)
+        started = time.perf_counter()
+        questions = len(processor.process_pdf_in_batches(pdf_path, ""))
+        durations.append(time.perf_counter() - started)
+    return durations, backend.calls, questions
+
+
+def run_app(args, pdf_path, workdir):
+    """Jobs uploaded to the FastAPI app, processed by its queue and job subprocesses"""
+    os.environ["JOB_STORE"] = "sqlite:" + os.path.join(workdir, "jobs.db")
+    # Uploads and results go to the work directory, not the repository's tempUploads/ and Outputs/
+    os.environ["STORAGE_DIR"] = workdir
+    from fastapi.testclient import TestClient
+    import main
+    from mcq_extractor import telemetry
+
+    durations, questions = [], 0
+    with TestClient(main.app) as client:
+        for _ in range(args.jobs):
+            started = time.perf_counter()
+            with open(pdf_path, "rb") as f:
+                response = client.post("/upload", data={"customInput": "bench"}, files={"file": ("bench.pdf", f, "application/pdf")}, follow_redirects=False)
+            uuid = response.headers["location"].rsplit("/", 1)[-1]
+            since = 0
+            while True:
+                state = client.get(f"/metadata/{uuid}/wait", params={"since": since, "timeout": 30}).json()
+                if state["finished"]:
+                    break
+                since = state["job"]["version"]
+            durations.append(time.perf_counter() - started)
+            questions = len(client.get(f"/json/{uuid}").json()["data"])
+
+    calls = sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in telemetry.registry.render().splitlines()
+        if line.startswith("mcq_gemini_calls_total")
+    )
+    return durations, int(calls), questions
+
+
+def run_size(args, pages, results):
+    """Benchmark one document size in its own process, the result goes to the results queue"""
+    if not args.verbose:
+        # Quiet the pipeline's own output, job subprocesses inherit these descriptors
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+    workdir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    try:
+        configure(args, workdir)
+        pdf_path = os.path.join(workdir, f"synthetic-{pages}.pdf")
+        make_pdf(pdf_path, pages)
+        runner = run_app if args.app else run_processor
+        started = time.perf_counter()
+        durations, calls, questions = runner(args, pdf_path, workdir)
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Kilobytes on Linux, job subprocesses count as children
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    results.put({
+        "pages": pages,
+        "jobs_per_min": len(durations) / elapsed * 60,
+        "p50": percentile(durations, 0.5),
+        "p99": percentile(durations, 0.99),
+        "peak_mb": peak_kb / 1024,
+        "calls": calls,
+        "questions": questions,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--jobs", type=int, default=3, help="jobs per document size")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency per call, seconds")
+    parser.add_argument("--truncate", type=float, default=0.0, help="share of truncated responses")
+    parser.add_argument("--empty", type=float, default=0.0, help="share of empty responses")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of 500 errors")
+    parser.add_argument("--invalid", type=float, default=0.0, help="share of responses with an invalid answer, escalated by the router")
+    parser.add_argument("--ladder", default="gemini-2.5-flash,gemini-2.5-pro", help="MODEL_LADDER")
+    parser.add_argument("--model-latency", default="", help='FAKE_MODEL_LATENCY, e.g. "gemini-2.5-flash=0.2,gemini-2.5-pro=1"')
+    parser.add_argument("--concurrency", type=int, default=4, help="BATCH_CONCURRENCY")
+    parser.add_argument("--local-parser", action="store_true", help="let the local parser take the clean pages")
+    parser.add_argument("--app", action="store_true", help="go through the FastAPI app and job subprocesses")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's output")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'pages':>6} {'jobs/min':>9} {'p50 s':>8} {'p99 s':>8} {'peak MB':>8} {'calls':>6} {'questions':>9}")
+    for pages in args.pages:
+        results = context.Queue()
+        # A plain process, not a pool worker: in --app mode it starts job subprocesses itself
+        process = context.Process(target=run_size, args=(args, pages, results))
+        process.start()
+        while True:
+            try:
+                result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    sys.exit(f"Benchmark of {pages} pages failed, run with --verbose to see why")
+        process.join()
+        print(f"{result['pages']:>6} {result['jobs_per_min']:>9.1f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+              f"{result['peak_mb']:>8.1f} {result['calls']:>6} {result['questions']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,211 @@
 import os
-import json
+import time
+import threading
+from mcq_extractor.checkpoint import checkpoint_path
+from mcq_extractor import telemetry
+from mcq_extractor.backends import remote_file_prefix
+from results import result_files
+from storage import storage_path
+from job_events import ACTIVE_STATUSES
 from datetime import datetime, timedelta , timezone
 
-def cleanup_files(max_age_hours=30):
+
+def _remove(path):
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def cleanup_files(job_store, max_age_hours=30):
+    """Delete the jobs uploaded more than max_age_hours ago, with their files.
+
+    Only expired jobs are read, thanks to the upload_timestamp index, and each
+    is deleted from the store once handled, so the next run doesn't read it
+    again. Jobs still queued or running are left alone. Returns the uuids of
+    the jobs deleted.
+    """
     try:
-        # Read metadata
-        with open("metadata/metadata_list.json", "r") as f:
-            metadata_list = json.load(f)
-        
         cutoff_time = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
 
         files_to_remove = []
-        
-        for metadata in metadata_list:
+
+        for metadata in job_store.list_uploaded_before(cutoff_time):
+            if metadata["status"] in ACTIVE_STATUSES:
+                continue
             try:
-                # Check JSON file age
-                json_path = metadata["json_filename"]
-                if not os.path.exists(json_path):
-                    continue
-                    
-                uploadedAt = datetime.fromisoformat(metadata["upload_timestamp"])
-
-                # If file is old enough, delete it
-                if uploadedAt <= cutoff_time:
-                    # Delete JSON file
-                    os.unlink(json_path)
-                    files_to_remove.append(metadata["uuid"])
-                    print(f"Deleted files for job: {metadata['uuid']}")
-                    
+                json_path = storage_path(metadata["json_filename"])
+                # Jobs that timed out or crashed only left a checkpoint behind
+                _remove(checkpoint_path(json_path))
+                # The JSON file with its index and compressed copies
+                for path in result_files(json_path):
+                    _remove(path)
+                files_to_remove.append(metadata["uuid"])
+
             except Exception as e:
                 print(f"Error processing {metadata.get('uuid', 'unknown')}: {e}")
-        
-        # Update metadata file
+
+        # Update job store
         if files_to_remove:
-            updated_metadata = [m for m in metadata_list if m["uuid"] not in files_to_remove]
-            with open("metadata/metadata_list.json", "w") as f:
-                json.dump(updated_metadata, f, indent=4)
-            print(f"Removed {len(files_to_remove)} entries from metadata")
-                
+            job_store.delete(files_to_remove)
+            print(f"Removed {len(files_to_remove)} expired jobs")
+        return files_to_remove
+
     except Exception as e:
-        print(f"Cleanup error: {e}")
\ No newline at end of file
+        print(f"Cleanup error: {e}")
+        return []
+
+
+def cleanup_uploads(job_store, upload_dir, max_age_hours=24):
+    """Delete files of the upload directory that no waiting or running job needs.
+
+    Uploads of finished jobs are deleted by the job itself, this catches
+    the ones a crash left behind and Office lock files (~$name.docx). Files
+    younger than max_age_hours are kept, an upload may still be arriving.
+    """
+    active = set()
+    for metadata in job_store.list_by_status(ACTIVE_STATUSES):
+        file_location = storage_path(metadata.get("file_location")) or ""
+        active.add(os.path.abspath(file_location))
+        # A DOCX job may have converted its upload to a PDF next to it
+        active.add(os.path.abspath(os.path.splitext(file_location)[0] + ".pdf"))
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    try:
+        entries = list(os.scandir(upload_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if not entry.is_file() or entry.stat().st_mtime > cutoff or os.path.abspath(entry.path) in active:
+                continue
+        except FileNotFoundError:
+            continue
+        if _remove(entry.path):
+            removed += 1
+    if removed:
+        print(f"Removed {removed} orphaned uploads")
+    return removed
+
+
+def release_remote_files(files, backend, uuids):
+    """Delete the remote files that only deleted jobs used"""
+    removed = 0
+    for name in files.release_jobs(uuids):
+        try:
+            backend.delete_file(name)
+            removed += 1
+        except Exception as e:
+            print(f"Could not delete remote file {name}: {e}")
+    return removed
+
+
+def cleanup_remote_files(backend, max_age_hours=24, keep=()):
+    """Delete the files this deployment uploaded to the model provider more than max_age_hours ago.
+
+    Gemini keeps uploads for 48 hours against the project's storage quota.
+    Only files whose display name carries REMOTE_FILE_PREFIX are ours, other
+    apps may upload with the same key. Files named in keep (the registry's,
+    which jobs may still reuse) are left to release_remote_files.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    prefix = remote_file_prefix()
+    removed = 0
+    for remote_file in backend.list_files():
+        created = getattr(remote_file, "create_time", None)
+        display_name = getattr(remote_file, "display_name", None) or ""
+        if created is None or created > cutoff or remote_file.name in keep or not display_name.startswith(prefix):
+            continue
+        try:
+            backend.delete_file(remote_file.name)
+            removed += 1
+        except Exception as e:
+            print(f"Could not delete remote file {remote_file.name}: {e}")
+    if removed:
+        print(f"Deleted {removed} remote files")
+    return removed
+
+
+class Janitor:
+    """Background thread that expires old jobs and their files.
+
+    Every interval it deletes expired jobs with their results and
+    checkpoints, orphaned uploads, expired or excess result cache entries
+    and files uploaded to Gemini: those of the registry once the jobs that
+    used them are deleted, untracked ones when they get old. It runs off
+    the request path, an upload never waits for it. Every API process
+    starts one, the job store lets only one of them sweep per interval.
+    Each retention can be turned off with 0.
+    """
+
+    def __init__(self, job_store, upload_dir, cache=None, files=None, backend_factory=None, interval_seconds=None,
+                 output_hours=None, upload_hours=None, remote_file_hours=None):
+        self.job_store = job_store
+        self.upload_dir = upload_dir
+        self.cache = cache
+        self.files = files  # RemoteFileRegistry shared with the jobs
+        self.backend_factory = backend_factory  # Called once, on the first remote file sweep
+        self.interval_seconds = interval_seconds or int(os.getenv("JANITOR_INTERVAL_MINUTES", "15")) * 60
+        self.output_hours = output_hours if output_hours is not None else float(os.getenv("OUTPUT_RETENTION_HOURS", "30"))
+        self.upload_hours = upload_hours if upload_hours is not None else float(os.getenv("UPLOAD_RETENTION_HOURS", "24"))
+        self.remote_file_hours = remote_file_hours if remote_file_hours is not None else float(os.getenv("GEMINI_FILE_RETENTION_HOURS", "24"))
+        self._backend = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self._claim_sweep():
+                self.run_once()
+            self._stop.wait(self.interval_seconds)
+
+    def _claim_sweep(self):
+        """True when no other process of the deployment has swept within the interval"""
+        try:
+            return self.job_store.claim_periodic("janitor", self.interval_seconds)
+        except Exception as e:
+            print(f"Cleanup error: {e}")
+            return False
+
+    def run_once(self):
+        """One sweep, returns what was removed per kind"""
+        removed = {}
+        with telemetry.span("janitor") as stage:
+            expired = cleanup_files(self.job_store, self.output_hours) if self.output_hours else []
+            removed["jobs"] = len(expired)
+            if expired and self.files is not None and self.backend_factory:
+                removed["released_files"] = self._guarded(lambda: release_remote_files(self.files, self._remote_backend(), expired))
+            if self.upload_hours:
+                removed["uploads"] = self._guarded(cleanup_uploads, self.job_store, self.upload_dir, self.upload_hours)
+            if self.cache is not None:
+                removed["cache_entries"] = self._guarded(self.cache.evict)
+            if self.remote_file_hours and self.backend_factory:
+                keep = self.files.names() if self.files is not None else ()
+                removed["remote_files"] = self._guarded(lambda: cleanup_remote_files(self._remote_backend(), self.remote_file_hours, keep))
+            stage.update(removed)
+        for kind, count in removed.items():
+            if count:
+                telemetry.inc("mcq_janitor_removed_total", count, kind=kind)
+        return removed
+
+    def _remote_backend(self):
+        if self._backend is None:
+            self._backend = self.backend_factory()
+        return self._backend
+
+    @staticmethod
+    def _guarded(work, *args):
+        try:
+            return work(*args)
+        except Exception as e:
+            print(f"Cleanup error: {e}")
+            return 0
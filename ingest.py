@@ -0,0 +1,234 @@
+"""Bulk ingestion: many documents as one batch of jobs.
+
+The /bulk endpoint and the command line below both turn every PDF or DOCX
+(directly, or found in a ZIP) into a regular job tagged with a batch_id, so
+each document goes through the same job subprocess and MCQBatchProcessor
+pipeline as a single upload. Model calls of all jobs share the host-wide
+quota and in-flight limit of ModelClient.
+
+    python ingest.py <directory> [--custom-input "..."] [--workers 8]
+"""
+import os
+import sys
+import time
+import uuid
+import hashlib
+import zipfile
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from storage import OUTPUT_DIRECTORY, storage_location, storage_path, upload_directory, output_directory, ensure_directories
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx')
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class DocumentTooLargeError(Exception):
+    """Raised when a document in a bulk upload exceeds the per-file limit"""
+
+
+def is_supported(filename):
+    name = os.path.basename(filename)
+    # Office lock files (~$name.docx) and hidden files are not documents
+    return name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith(("~$", "."))
+
+
+def new_batch_id():
+    return str(uuid.uuid4())
+
+
+def job_metadata(unique_id, original_filename, file_location, file_hash, custom_input, priority=0, batch_id=None, status="Queued"):
+    """Metadata of a new job, as stored by the job store, with storage-relative file locations"""
+    metadata = {
+        "uuid": unique_id,
+        "original_filename": original_filename,
+        "pdf_filename": os.path.basename(file_location),
+        "json_filename": os.path.join(OUTPUT_DIRECTORY, unique_id + ".json"),
+        "status": status,
+        "upload_timestamp": datetime.now().astimezone().isoformat(),
+        "sha256": file_hash,
+        "file_location": storage_location(file_location),
+        "custom_input": custom_input,
+        "priority": priority,
+    }
+    if batch_id:
+        metadata["batch_id"] = batch_id
+    return metadata
+
+
+def copy_document(source, destination, max_bytes):
+    """Copy a readable binary file object to destination in chunks, returns its SHA-256"""
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(destination, "wb") as target:
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DocumentTooLargeError(f"exceeds the {max_bytes // (1024 * 1024)} MB limit")
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    return digest.hexdigest()
+
+
+def store_document(source, original_filename, upload_dir, max_bytes):
+    """Copy one document into the upload directory under a new job uuid.
+
+    Returns (uuid, file_location, sha256). The name in the upload directory
+    never comes from the original path, ZIP entries can't write elsewhere.
+    """
+    unique_id = str(uuid.uuid4())
+    extension = os.path.splitext(original_filename)[1].lower()
+    file_location = os.path.join(upload_dir, unique_id + extension)
+    return unique_id, file_location, copy_document(source, file_location, max_bytes)
+
+
+def expand_zip(zip_path, upload_dir, max_bytes, max_files):
+    """Store the PDFs and DOCX files found in a ZIP.
+
+    Returns (stored, rejected): stored is a list of (original name, uuid,
+    file_location, sha256), rejected a list of (name, reason).
+    """
+    stored, rejected = [], []
+    with zipfile.ZipFile(zip_path) as archive:
+        for entry in archive.infolist():
+            if entry.is_dir() or entry.filename.startswith("__MACOSX/"):
+                continue
+            if not is_supported(entry.filename):
+                rejected.append((entry.filename, "not a PDF or DOCX file"))
+                continue
+            if len(stored) >= max_files:
+                rejected.append((entry.filename, f"more than {max_files} documents in the batch"))
+                continue
+            if entry.file_size > max_bytes:
+                rejected.append((entry.filename, f"exceeds the {max_bytes // (1024 * 1024)} MB limit"))
+                continue
+            try:
+                with archive.open(entry) as source:
+                    unique_id, file_location, file_hash = store_document(source, entry.filename, upload_dir, max_bytes)
+            except (DocumentTooLargeError, zipfile.BadZipFile, OSError) as e:
+                rejected.append((entry.filename, str(e)))
+                continue
+            stored.append((entry.filename, unique_id, file_location, file_hash))
+    return stored, rejected
+
+
+def batch_summary(jobs, latest=None):
+    """Aggregate state of a batch's jobs.
+
+    latest, when given, maps a job uuid to its event bus state, whose
+    progress (batch i of n) counts running jobs in part.
+    """
+    counts = {"queued": 0, "processing": 0, "processed": 0, "failed": 0, "cancelled": 0}
+    done = 0.0
+    entries = []
+    for metadata in jobs:
+        status = metadata["status"]
+        progress = {}
+        if status in ("Queued", "Pending"):
+            counts["queued"] += 1
+        elif status == "Processing":
+            counts["processing"] += 1
+            state = latest(metadata["uuid"]) if latest else None
+            progress = (state or {}).get("progress") or {}
+            if progress.get("batches"):
+                done += min(progress.get("batch", 0) / progress["batches"], 1.0)
+        elif status.startswith("Processed"):
+            counts["processed"] += 1
+            done += 1
+        elif status == "Cancelled":
+            counts["cancelled"] += 1
+            done += 1
+        else:
+            counts["failed"] += 1
+            done += 1
+        entries.append({
+            "uuid": metadata["uuid"],
+            "original_filename": metadata.get("original_filename"),
+            "status": status,
+            "progress": progress,
+        })
+    return {
+        "documents": len(jobs),
+        **counts,
+        "finished": counts["queued"] == 0 and counts["processing"] == 0,
+        "progress": round(done / len(jobs), 4) if jobs else 1.0,
+        "jobs": entries,
+    }
+
+
+def _walk(directory):
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if is_supported(filename):
+                yield os.path.join(root, filename)
+
+
+def main():
+    from dotenv import load_dotenv
+    from job_store import create_job_store
+    from processing import JobRunner, remove_job_files
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="directory searched recursively for PDF and DOCX files")
+    parser.add_argument("--custom-input", default="", help="additional extraction instructions for every document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="documents processed at the same time")
+    parser.add_argument("--priority", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    job_store = create_job_store()
+    max_bytes = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+    ensure_directories()
+
+    batch_id = new_batch_id()
+    jobs = []
+    for path in _walk(args.directory):
+        try:
+            with open(path, "rb") as source:
+                unique_id, file_location, file_hash = store_document(source, path, upload_directory(), max_bytes)
+        except (DocumentTooLargeError, OSError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        # Pending, not Queued: neither an API's queue nor worker.py may take these jobs too
+        metadata = job_metadata(unique_id, os.path.relpath(path, args.directory), file_location, file_hash,
+                                args.custom_input, args.priority, batch_id, status="Pending")
+        job_store.add(metadata)
+        jobs.append(metadata)
+    if not jobs:
+        sys.exit(f"No PDF or DOCX files found in {args.directory}")
+    print(f"Batch {batch_id}: {len(jobs)} documents, {args.workers} at a time")
+
+    # Each job runs in its own subprocess, exactly as queued uploads do
+    runner = JobRunner(job_store)
+    started = time.monotonic()
+
+    def run(metadata):
+        # Cancelled through the API in the meantime
+        if job_store.transition(metadata["uuid"], "Pending", "Processing"):
+            runner.run(metadata)
+        return job_store.get(metadata["uuid"])
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(run, metadata) for metadata in jobs]
+        try:
+            for finished, future in enumerate(as_completed(futures), start=1):
+                metadata = future.result()
+                print(f"[{finished}/{len(jobs)}] {metadata['original_filename']}: {metadata['status']}")
+        finally:
+            # Interrupted: the jobs not started would be left pending forever, cancelled they are skipped
+            for metadata in jobs:
+                if job_store.transition(metadata["uuid"], "Pending", "Cancelled"):
+                    remove_job_files(storage_path(metadata["file_location"]))
+
+    summary = batch_summary(job_store.list_by_batch(batch_id))
+    print(f"Batch {batch_id} done in {time.monotonic() - started:.0f}s: "
+          f"{summary['processed']} processed, {summary['failed']} failed, results in {output_directory()}")
+
+
+if __name__ == "__main__":
+    main()
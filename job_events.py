@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+# "Pending" jobs wait for the command line batch (ingest.py) that stored them, no queue takes them
+ACTIVE_STATUSES = ("Queued", "Pending", "Processing")
+
+
+def is_finished(status):
+    """True once a job can't change any more (processed, failed or cancelled)"""
+    return status is not None and status not in ACTIVE_STATUSES
+
+
+class JobEventBus:
+    """In-process publish/subscribe of job status and progress.
+
+    Worker threads publish status changes and the progress relayed from the
+    job subprocess, request handlers wait for the next change of a job
+    without touching the job store. Only the latest state of each job is
+    kept: a waiter that falls behind gets the newest snapshot, not every
+    intermediate event. States of the oldest jobs are dropped past max_jobs,
+    callers fall back to the job store for those.
+    """
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._states = OrderedDict()
+        self._waiters = {}  # uuid -> [(event loop, asyncio.Event)]
+        self._lock = threading.Lock()
+
+    def publish(self, uuid, status=None, progress=None):
+        """Update a job's state and wake its waiters, callable from any thread"""
+        with self._lock:
+            state = self._states.get(uuid)
+            if state is None:
+                state = {"uuid": uuid, "version": 0, "status": None, "progress": {}}
+                self._states[uuid] = state
+                while len(self._states) > self.max_jobs:
+                    self._states.popitem(last=False)
+            if status is not None:
+                state["status"] = status
+            if progress:
+                state["progress"] = dict(progress)
+            state["version"] += 1
+            waiters = self._waiters.pop(uuid, [])
+
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                pass  # The waiter's event loop is already closed
+
+    def latest(self, uuid):
+        """Snapshot of a job's state, None when the bus hasn't seen the job"""
+        with self._lock:
+            state = self._states.get(uuid)
+            return _snapshot(state)
+
+    def active_jobs(self):
+        """uuids of the jobs whose latest known status isn't final"""
+        with self._lock:
+            return [uuid for uuid, state in self._states.items() if not is_finished(state["status"])]
+
+    async def wait(self, uuid, since=0, timeout=30):
+        """Return the job's state once its version is past since, or after timeout"""
+        waiter = asyncio.Event()
+        with self._lock:
+            state = self._states.get(uuid)
+            if state is not None and state["version"] > since:
+                return _snapshot(state)
+            entry = (asyncio.get_running_loop(), waiter)
+            self._waiters.setdefault(uuid, []).append(entry)
+
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(uuid, [])
+                if entry in waiters:
+                    waiters.remove(entry)
+                if not waiters:
+                    self._waiters.pop(uuid, None)
+        return self.latest(uuid)
+
+
+def _snapshot(state):
+    if state is None:
+        return None
+    return dict(state, progress=dict(state["progress"]))
@@ -0,0 +1,198 @@
+import os
+import heapq
+import itertools
+import threading
+from storage import storage_path
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when the queue is saturated"""
+
+
+class JobQueue:
+    """Bounded priority queue of extraction jobs served by a fixed worker pool.
+
+    The queue itself is rebuilt from the job store: jobs are saved as
+    "Queued" before they are submitted, so anything still "Queued" or
+    "Processing" when the server stops is picked up again by recover().
+    Higher priority runs first, jobs with the same priority run in
+    submission order. Jobs of bulk batches wait in the same queue but don't
+    count against max_queued, a backfill must not lock out single uploads.
+    """
+
+    def __init__(self, job_store, handler, workers=None, max_queued=None, events=None):
+        self.job_store = job_store
+        self.handler = handler  # Called with the job metadata dict, from a worker thread
+        self.events = events  # Event bus told about jobs the handler failed
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_queued = max_queued or int(os.getenv("JOB_QUEUE_SIZE", "50"))
+        self._heap = []
+        self._bulk = set()  # uuids of waiting jobs that belong to a bulk batch
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        self.recover()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Job queue started with {self.workers} workers")
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+    def recover(self):
+        """Queue again the jobs left unfinished by a previous run"""
+        recovered = 0
+        for metadata in self.job_store.list_by_status(["Queued", "Processing"]):
+            file_location = storage_path(metadata.get("file_location"))
+            if not file_location or not os.path.isfile(file_location):
+                self.job_store.update_status(metadata["uuid"], "Error: Upload lost on restart")
+                continue
+            with self._condition:
+                heapq.heappush(self._heap, (-metadata.get("priority", 0), next(self._counter), metadata["uuid"]))
+                if metadata.get("batch_id"):
+                    self._bulk.add(metadata["uuid"])
+            self.job_store.update_status(metadata["uuid"], "Queued")
+            recovered += 1
+        if recovered:
+            print(f"Recovered {recovered} unfinished jobs")
+        return recovered
+
+    def submit(self, uuid, priority=0, bulk=False):
+        """Queue a job and return its position, raise QueueFullError when saturated"""
+        with self._condition:
+            if not bulk and self._saturated():
+                raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+            heapq.heappush(self._heap, (-priority, next(self._counter), uuid))
+            if bulk:
+                self._bulk.add(uuid)
+            self._condition.notify()
+            return self._position(uuid)
+
+    def saturated(self):
+        """True when single uploads would be refused"""
+        with self._condition:
+            return self._saturated()
+
+    def _saturated(self):
+        return len(self._heap) - len(self._bulk) >= self.max_queued
+
+    def cancel(self, uuid):
+        """Remove a waiting job from the queue, return False if it isn't waiting"""
+        with self._condition:
+            for index, entry in enumerate(self._heap):
+                if entry[2] == uuid:
+                    self._heap.pop(index)
+                    heapq.heapify(self._heap)
+                    self._bulk.discard(uuid)
+                    return True
+        return False
+
+    def position(self, uuid):
+        """1-based position of a waiting job, None once it has started"""
+        with self._condition:
+            return self._position(uuid)
+
+    def _position(self, uuid):
+        for position, entry in enumerate(sorted(self._heap), start=1):
+            if entry[2] == uuid:
+                return position
+        return None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                _, _, uuid = heapq.heappop(self._heap)
+                self._bulk.discard(uuid)
+
+            metadata = self.job_store.get(uuid)
+            if metadata is None or metadata["status"] != "Queued":
+                continue
+            try:
+                self.handler(metadata)
+            except Exception as e:
+                print(f"❌ Job {uuid} failed: {e}")
+                status = f"Error: {str(e)}"
+                self.job_store.update_status(uuid, status)
+                if self.events is not None:
+                    self.events.publish(uuid, status=status)
+
+
+class SharedJobQueue:
+    """JobQueue interface over the job store, for API nodes whose jobs run in worker processes.
+
+    With JOB_EXECUTION=workers the job table is the queue: an upload saved
+    as "Queued" is claimed by the next free worker (worker.py), so the API
+    process keeps no job state and can run as several uvicorn workers. Status changes written by workers are brought
+    to the API's event bus by polling the jobs someone follows.
+    """
+
+    def __init__(self, job_store, events=None, max_queued=None, poll_seconds=1.0):
+        self.job_store = job_store
+        self.events = events
+        self.max_queued = max_queued or int(os.getenv("JOB_QUEUE_SIZE", "50"))
+        self.poll_seconds = poll_seconds
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self.events is not None:
+            threading.Thread(target=self._watch, name="job-watcher", daemon=True).start()
+        print("Jobs are run by worker processes")
+
+    def stop(self):
+        self._stopping.set()
+
+    def submit(self, uuid, priority=0, bulk=False):
+        """The job is already queued in the store, only check the limit and return its position"""
+        if not bulk and self.job_store.count_queued(include_bulk=False) > self.max_queued:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+        return self.job_store.queue_position(uuid)
+
+    def saturated(self):
+        return self.job_store.count_queued(include_bulk=False) >= self.max_queued
+
+    def cancel(self, uuid):
+        return self.job_store.transition(uuid, "Queued", "Cancelled")
+
+    def cancel_running(self, uuid):
+        """Mark a running job cancelled, its worker stops it on its next heartbeat"""
+        if not self.job_store.transition(uuid, "Processing", "Cancelled"):
+            return False
+        if self.events is not None:
+            self.events.publish(uuid, status="Cancelled")
+        return True
+
+    def position(self, uuid):
+        return self.job_store.queue_position(uuid)
+
+    def __len__(self):
+        return self.job_store.count_queued()
+
+    def _watch(self):
+        while not self._stopping.wait(self.poll_seconds):
+            for uuid in self.events.active_jobs():
+                try:
+                    metadata = self.job_store.get(uuid)
+                except Exception as e:
+                    print(f"Job watcher error: {e}")
+                    break
+                state = self.events.latest(uuid)
+                if metadata is None or state is None:
+                    continue
+                progress = metadata.get("progress") or {}
+                if metadata["status"] != state["status"] or (progress and progress != state["progress"]):
+                    self.events.publish(uuid, status=metadata["status"], progress=progress)
@@ -0,0 +1,401 @@
+import os
+import sys
+import json
+import sqlite3
+import time
+import threading
+from datetime import datetime, timezone
+
+DEFAULT_JOB_STORE = "sqlite:metadata/jobs.db"
+LEGACY_METADATA_FILE = "metadata/metadata_list.json"
+
+
+def _utc_key(timestamp):
+    """Normalise an ISO timestamp to UTC so stored values sort chronologically"""
+    try:
+        return datetime.fromisoformat(timestamp).astimezone(timezone.utc).isoformat()
+    except (TypeError, ValueError):
+        return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """Interface of the job metadata stores.
+
+    A job is the metadata dict created by /upload. Implementations must make
+    each method atomic, several worker threads and processes use the store
+    at the same time.
+    """
+
+    def add(self, metadata):
+        raise NotImplementedError
+
+    def get(self, uuid):
+        raise NotImplementedError
+
+    def update(self, uuid, **fields):
+        raise NotImplementedError
+
+    def update_status(self, uuid, status):
+        return self.update(uuid, status=status)
+
+    def list(self):
+        raise NotImplementedError
+
+    def list_by_status(self, statuses):
+        raise NotImplementedError
+
+    def list_uploaded_before(self, cutoff):
+        raise NotImplementedError
+
+    def list_by_batch(self, batch_id):
+        raise NotImplementedError
+
+    def delete(self, uuids):
+        raise NotImplementedError
+
+    def transition(self, uuid, expected, status):
+        """Set a job's status only if it is currently expected, returns whether it was"""
+        raise NotImplementedError
+
+    def count_queued(self, include_bulk=True):
+        raise NotImplementedError
+
+    def queue_position(self, uuid):
+        raise NotImplementedError
+
+    # Leases, for jobs run by worker processes (see worker.py)
+
+    def claim(self, worker, lease_seconds):
+        """Take the next queued job for worker, returns its metadata or None"""
+        raise NotImplementedError
+
+    def renew_leases(self, worker, uuids, lease_seconds):
+        """Extend worker's leases, returns the uuids it still holds"""
+        raise NotImplementedError
+
+    def release_lease(self, uuid, worker, requeue=False):
+        raise NotImplementedError
+
+    def reclaim_expired(self, max_attempts):
+        """Queue again the jobs whose lease ran out, returns (requeued, failed) uuids"""
+        raise NotImplementedError
+
+    def claim_periodic(self, name, interval_seconds):
+        """True for the one caller, across processes, that should run task name now.
+
+        Nobody else gets True until interval_seconds have passed.
+        """
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by SQLite in WAL mode.
+
+    Every job is one row keyed by uuid. status and upload_timestamp are real
+    columns with indexes, the full metadata dict is kept as JSON in `data`.
+    A job run by a worker process also has a lease: its owner and the time
+    it runs out, pushed back by the worker's heartbeats. WAL needs every
+    process on the same host, it isn't safe on a network filesystem.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._create_schema()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode, writes that read first open an explicit transaction
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                uuid TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                upload_timestamp TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+            CREATE INDEX IF NOT EXISTS idx_jobs_upload_timestamp ON jobs(upload_timestamp);
+            CREATE INDEX IF NOT EXISTS idx_jobs_batch_id ON jobs(json_extract(data, '$.batch_id'));
+            CREATE TABLE IF NOT EXISTS store_info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        # Stores created before leases existed
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+        if "lease_owner" not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN lease_owner TEXT")
+            connection.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease_expires ON jobs(lease_expires) WHERE lease_expires IS NOT NULL")
+
+    @staticmethod
+    def _row_to_metadata(row):
+        metadata = json.loads(row["data"])
+        metadata["status"] = row["status"]
+        return metadata
+
+    def add(self, metadata):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO jobs (uuid, status, upload_timestamp, data) VALUES (?, ?, ?, ?)",
+            (metadata["uuid"], metadata["status"], _utc_key(metadata.get("upload_timestamp")), json.dumps(metadata)),
+        )
+
+    def get(self, uuid):
+        row = self._connection().execute(
+            "SELECT status, data FROM jobs WHERE uuid = ?", (uuid,)
+        ).fetchone()
+        return self._row_to_metadata(row) if row else None
+
+    def update(self, uuid, **fields):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT status, data FROM jobs WHERE uuid = ?", (uuid,)).fetchone()
+            if row is None:
+                connection.execute("ROLLBACK")
+                return None
+            metadata = self._row_to_metadata(row)
+            metadata.update(fields)
+            connection.execute(
+                "UPDATE jobs SET status = ?, data = ? WHERE uuid = ?",
+                (metadata["status"], json.dumps(metadata), uuid),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return metadata
+
+    def update_status(self, uuid, status):
+        # Status lives in its own column, no need to rewrite the JSON document
+        cursor = self._connection().execute("UPDATE jobs SET status = ? WHERE uuid = ?", (status, uuid))
+        return cursor.rowcount == 1
+
+    def list(self):
+        rows = self._connection().execute("SELECT status, data FROM jobs ORDER BY upload_timestamp")
+        return [self._row_to_metadata(row) for row in rows]
+
+    def list_by_status(self, statuses):
+        statuses = list(statuses)
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._connection().execute(
+            f"SELECT status, data FROM jobs WHERE status IN ({placeholders}) ORDER BY upload_timestamp", statuses
+        )
+        return [self._row_to_metadata(row) for row in rows]
+
+    def list_uploaded_before(self, cutoff):
+        rows = self._connection().execute(
+            "SELECT status, data FROM jobs WHERE upload_timestamp <= ? ORDER BY upload_timestamp",
+            (_utc_key(cutoff.isoformat()),),
+        )
+        return [self._row_to_metadata(row) for row in rows]
+
+    def list_by_batch(self, batch_id):
+        # Same expression as idx_jobs_batch_id, so the index is used
+        rows = self._connection().execute(
+            "SELECT status, data FROM jobs WHERE json_extract(data, '$.batch_id') = ? ORDER BY upload_timestamp",
+            (batch_id,),
+        )
+        return [self._row_to_metadata(row) for row in rows]
+
+    def delete(self, uuids):
+        uuids = list(uuids)
+        if not uuids:
+            return 0
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("DELETE FROM jobs WHERE uuid = ?", [(uuid,) for uuid in uuids])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return len(uuids)
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def transition(self, uuid, expected, status):
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ? WHERE uuid = ? AND status = ?", (status, uuid, expected)
+        )
+        return cursor.rowcount == 1
+
+    def count_queued(self, include_bulk=True):
+        query = "SELECT COUNT(*) FROM jobs WHERE status = 'Queued'"
+        if not include_bulk:
+            query += " AND json_extract(data, '$.batch_id') IS NULL"
+        return self._connection().execute(query).fetchone()[0]
+
+    def queue_position(self, uuid):
+        """1-based position among queued jobs, by priority then upload time, as workers claim them"""
+        row = self._connection().execute(
+            "SELECT upload_timestamp, COALESCE(json_extract(data, '$.priority'), 0) AS priority FROM jobs WHERE uuid = ? AND status = 'Queued'",
+            (uuid,),
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = self._connection().execute("""
+            SELECT COUNT(*) FROM jobs WHERE status = 'Queued' AND (
+                COALESCE(json_extract(data, '$.priority'), 0) > ?
+                OR (COALESCE(json_extract(data, '$.priority'), 0) = ? AND upload_timestamp < ?))
+        """, (row["priority"], row["priority"], row["upload_timestamp"])).fetchone()[0]
+        return ahead + 1
+
+    def claim(self, worker, lease_seconds):
+        def work(connection):
+            row = connection.execute("""
+                SELECT uuid, status, data FROM jobs WHERE status = 'Queued'
+                ORDER BY COALESCE(json_extract(data, '$.priority'), 0) DESC, upload_timestamp LIMIT 1
+            """).fetchone()
+            if row is None:
+                return None
+            metadata = self._row_to_metadata(row)
+            metadata["status"] = "Processing"
+            metadata["worker"] = worker
+            metadata["attempts"] = metadata.get("attempts", 0) + 1
+            connection.execute(
+                "UPDATE jobs SET status = ?, data = ?, lease_owner = ?, lease_expires = ? WHERE uuid = ?",
+                (metadata["status"], json.dumps(metadata), worker, time.time() + lease_seconds, row["uuid"]),
+            )
+            return metadata
+
+        return self._transaction(work)
+
+    def renew_leases(self, worker, uuids, lease_seconds):
+        uuids = list(uuids)
+        if not uuids:
+            return set()
+        placeholders = ", ".join("?" for _ in uuids)
+
+        def work(connection):
+            connection.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? AND status = 'Processing' AND uuid IN ({placeholders})",
+                [time.time() + lease_seconds, worker, *uuids],
+            )
+            rows = connection.execute(
+                f"SELECT uuid FROM jobs WHERE lease_owner = ? AND status = 'Processing' AND uuid IN ({placeholders})",
+                [worker, *uuids],
+            )
+            return {row["uuid"] for row in rows}
+
+        return self._transaction(work)
+
+    def release_lease(self, uuid, worker, requeue=False):
+        status_update = ", status = 'Queued'" if requeue else ""
+        self._connection().execute(
+            f"UPDATE jobs SET lease_owner = NULL, lease_expires = NULL{status_update} WHERE uuid = ? AND lease_owner = ?",
+            (uuid, worker),
+        )
+
+    def reclaim_expired(self, max_attempts):
+        def work(connection):
+            requeued, failed = [], []
+            rows = connection.execute(
+                "SELECT uuid, status, data FROM jobs WHERE lease_expires < ?", (time.time(),)
+            ).fetchall()
+            for row in rows:
+                metadata = self._row_to_metadata(row)
+                if row["status"] != "Processing":
+                    status = row["status"]  # Finished or cancelled while its worker was gone
+                elif metadata.get("attempts", 0) >= max_attempts:
+                    status = "Error: Worker lost"
+                    failed.append(row["uuid"])
+                else:
+                    status = "Queued"
+                    requeued.append(row["uuid"])
+                connection.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL WHERE uuid = ?", (status, row["uuid"])
+                )
+            return requeued, failed
+
+        return self._transaction(work)
+
+    def claim_periodic(self, name, interval_seconds):
+        def work(connection):
+            key = f"last_run:{name}"
+            now = time.time()
+            row = connection.execute("SELECT value FROM store_info WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - float(row["value"]) < interval_seconds:
+                return False
+            connection.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)", (key, str(now)))
+            return True
+
+        return self._transaction(work)
+
+    def import_json_metadata(self, json_path=LEGACY_METADATA_FILE, force=False):
+        """One-time import of the legacy metadata_list.json file.
+
+        Jobs already in the store are left untouched. The import is recorded so
+        it doesn't run again on the next start.
+        """
+        connection = self._connection()
+        marker = connection.execute("SELECT value FROM store_info WHERE key = 'json_imported'").fetchone()
+        if (marker and not force) or not os.path.isfile(json_path):
+            return 0
+
+        try:
+            with open(json_path, "r") as f:
+                metadata_list = json.load(f)
+            if not isinstance(metadata_list, list):
+                metadata_list = []
+        except json.JSONDecodeError:
+            metadata_list = []
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            imported = 0
+            for metadata in metadata_list:
+                if not isinstance(metadata, dict) or "uuid" not in metadata:
+                    continue
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO jobs (uuid, status, upload_timestamp, data) VALUES (?, ?, ?, ?)",
+                    (metadata["uuid"], metadata.get("status", "Processing"), _utc_key(metadata.get("upload_timestamp")), json.dumps(metadata)),
+                )
+                imported += cursor.rowcount
+            connection.execute(
+                "INSERT OR REPLACE INTO store_info (key, value) VALUES ('json_imported', ?)",
+                (datetime.now(timezone.utc).isoformat(),),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        print(f"Imported {imported} jobs from {json_path}")
+        return imported
+
+
+def create_job_store(url=None):
+    """Build the job store configured by JOB_STORE (e.g. sqlite:metadata/jobs.db)"""
+    url = url or os.getenv("JOB_STORE", DEFAULT_JOB_STORE)
+    scheme, _, location = url.partition(":")
+    if scheme == "sqlite":
+        return SQLiteJobStore(location)
+    raise ValueError(f"Unsupported job store: {url}")
+
+
+if __name__ == "__main__":
+    # python job_store.py [metadata_list.json] -- import the legacy metadata file by hand
+    store = create_job_store()
+    store.import_json_metadata(sys.argv[1] if len(sys.argv) > 1 else LEGACY_METADATA_FILE, force=True)
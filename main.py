@@ -1,193 +1,107 @@
-from fastapi import FastAPI, File, UploadFile, BackgroundTasks, Form ,HTTPException
-from fastapi.responses import JSONResponse, FileResponse ,RedirectResponse
+from fastapi import FastAPI, File, UploadFile, Form ,HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse ,RedirectResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import os
-from mcq_extractor.batch_processor import MCQBatchProcessor
+import hashlib
 import uuid
+import zipfile
 from datetime import datetime , timezone
 import json 
+import asyncio
+from typing import List
 from dotenv import load_dotenv
-from cleanup import cleanup_files
-import sys
-import tempfile
-from docx import Document
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-import signal
-import threading
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-
-app = FastAPI()
+from cleanup import Janitor
+from job_store import create_job_store
+from job_queue import JobQueue, SharedJobQueue, QueueFullError
+from job_events import JobEventBus, is_finished
+from processing import JobRunner, remove_job_files
+from results import load_index, read_questions_bytes, full_body_chunks, etag_matches, preferred_encoding, stored_encoding, compress, ENCODING_SUFFIXES, FULL_PREFIX, FULL_SUFFIX
+from storage import storage_path, upload_directory, ensure_directories
+from ingest import job_metadata, expand_zip, store_document, is_supported, new_batch_id, batch_summary, DocumentTooLargeError
+from mcq_extractor.checkpoint import checkpoint_path, read_records
+from mcq_extractor.dedup import AdjacentBatchDeduplicator
+from mcq_extractor.cache import ResultCache
+from mcq_extractor.backends import create_backend
+from mcq_extractor.file_registry import RemoteFileRegistry
+from mcq_extractor import telemetry
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app):
+    job_queue.start()
+    janitor.start()
+    yield
+    janitor.stop()
+    job_queue.stop()
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv()
 api_key = os.getenv("API_KEY")
+max_upload_bytes = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+max_bulk_bytes = int(os.getenv("MAX_BULK_MB", "1024")) * 1024 * 1024
+max_bulk_files = int(os.getenv("MAX_BULK_FILES", "1000"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+STREAM_POLL_SECONDS = 1.0
+MIN_COMPRESS_BYTES = 1024  # Smaller pages of results go out uncompressed
 
+job_store = create_job_store()
+job_store.import_json_metadata()
 
-########################################## CALLING CONVERSION FUNCTION ##########################################
-def convert_docx_to_pdf_custom(docx_path, pdf_path):
-    """Convert DOCX to PDF using python-docx and reportlab"""
-    try:
-        # Read the DOCX file
-        doc = Document(docx_path)
-        
-        # Create PDF document
-        pdf_doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Extract text from DOCX and add to PDF
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():  # Only add non-empty paragraphs
-                p = Paragraph(paragraph.text, styles['Normal'])
-                story.append(p)
-                story.append(Spacer(1, 12))  # Add space between paragraphs
-        
-        # Build the PDF
-        pdf_doc.build(story)
-        return True
-        
-    except Exception as e:
-        print(f"Error in custom DOCX to PDF conversion: {e}")
-        return False
-
-# function for the conversion process call 
-def process_with_timeout(file_path: str, result_file_name: str, uuid: str, customInput: str, timeout_seconds=300):
-    """Process file with timeout handling"""
-    def target_function():
-        return process_file_core(file_path, result_file_name, uuid, customInput)
-    
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(target_function)
-        try:
-            result = future.result(timeout=timeout_seconds)
-            return result
-        except TimeoutError:
-            print(f"❌ Processing timeout after {timeout_seconds} seconds")
-            update_metadata(uuid, "Error: Processing timeout")
-            # Clean up files
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            pdf_path = file_path.replace('.docx', '.pdf') if file_path.endswith('.docx') else file_path
-            if pdf_path != file_path and os.path.exists(pdf_path):
-                os.remove(pdf_path)
-            return None
-        except Exception as e:
-            print(f"❌ Unexpected error during processing: {e}")
-            update_metadata(uuid, f"Error: {str(e)}")
-            return None
 
-def process_file_core(file_path: str, result_file_name: str, uuid: str, customInput: str):
-    """Core processing logic without timeout wrapper"""
-    if not os.path.isfile(file_path):
-        print(f"❌ File not found: {file_path}")
-        update_metadata(uuid, "Error: File not found")
-        return
-    
-    # Check if the file is a DOCX and needs conversion
-    pdf_path = file_path
-    if file_path.endswith('.docx'):
-        # Convert DOCX to PDF
-        pdf_path = file_path.replace('.docx', '.pdf')
-        try:
-            success = convert_docx_to_pdf_custom(file_path, pdf_path)
-            if success:
-                print(f"✅ Converted DOCX to PDF: {pdf_path}")
-                # Remove the original DOCX file
-                os.remove(file_path)
-            else:
-                print(f"❌ Error converting DOCX to PDF")
-                update_metadata(uuid, "Error: Failed to convert DOCX to PDF")
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return
-        except Exception as e:
-            print(f"❌ Exception during DOCX conversion: {e}")
-            update_metadata(uuid, f"Error: DOCX conversion failed - {str(e)}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return
-    
-    try:
-        # Process the PDF for MCQ extraction
-        processor = MCQBatchProcessor(api_key)
-        questions = processor.process_pdf_in_batches(pdf_path, customInput)
-       
-        if questions == []:
-            print("No questions found ")
-            update_metadata(uuid, "Processed, No questions found")
-        else:
-            print(f"Successfully extracted {len(questions)} questions")
-        
-        # Write result file
-        final_json = json.dumps(questions, indent=2, ensure_ascii=False)
-        with open(result_file_name, "w", encoding='utf-8') as f:
-            f.write(final_json)
-
-        print(f"Processing done, result saved as {result_file_name}")
-        update_metadata(uuid, "Processed")
-        
-    except Exception as e:
-        print(f"❌ Error during MCQ processing: {e}")
-        update_metadata(uuid, f"Error: MCQ processing failed - {str(e)}")
-    finally:
-        # Clean up the PDF file
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
-
-def process_file(file_path: str, result_file_name: str, uuid: str, customInput: str):
-    """Main process file function with timeout and error handling"""
-    return process_with_timeout(file_path, result_file_name, uuid, customInput, timeout_seconds=300)
-
-########################################## UPDATE METADATA ##########################################
-def update_metadata(uuid: str, status: str):
-    print("update")
-    with open("metadata/metadata_list.json", "r") as f:
-        metadata_list = json.load(f)
-    
-    # Find and update specific metadata
-    for metadata in metadata_list:
-         if metadata["uuid"] == uuid:
-               metadata.update({"status": status})
-               break
-    
-    # Write back to file
-    with open("metadata/metadata_list.json", "w") as f:
-         json.dump(metadata_list, f, indent=2)
+job_events = JobEventBus()
+job_runner = JobRunner(job_store, events=job_events)
 
-########################################## SAVING METADATA ##########################################
-def save_metadata(metadata):
-    print("SAVING")
-    try:
-        with open("metadata/metadata_list.json", "r") as f:
-            existing_data = json.load(f)
-            if not isinstance(existing_data, list):
-                existing_data = []
-    except json.JSONDecodeError:
-        existing_data = []
+def run_job(metadata):
+    """Job queue handler, runs one queued upload in a subprocess"""
+    uploaded = datetime.fromisoformat(metadata["upload_timestamp"])
+    if uploaded.tzinfo is None:
+        uploaded = uploaded.astimezone()  # Older metadata has local times without an offset
+    telemetry.observe("mcq_queue_wait_seconds", max((datetime.now(timezone.utc) - uploaded).total_seconds(), 0))
+
+    def claim():
+        # Registered with the runner by now, a cancel as soon as it is "Processing" stops it
+        if not job_store.transition(metadata["uuid"], "Queued", "Processing"):
+            return False  # Cancelled or taken by another process since it was queued
+        job_events.publish(metadata["uuid"], status="Processing")
+        return True
 
-    existing_data.append(metadata)
+    job_runner.run(metadata, claim=claim)
 
-    with open("metadata/metadata_list.json", "w") as f:
-        json.dump(existing_data, f, indent=4)
+# "local" runs jobs in this process's queue, "workers" leaves them to worker.py processes on the same host
+job_execution = os.getenv("JOB_EXECUTION", "local")
+if job_execution == "workers":
+    job_queue = SharedJobQueue(job_store, events=job_events, poll_seconds=STREAM_POLL_SECONDS)
+    cancel_running_job = job_queue.cancel_running
+else:
+    job_queue = JobQueue(job_store, run_job, events=job_events)
+    cancel_running_job = job_runner.cancel
 
 ########################################## LOADING METADATA ##########################################
 @app.get("/metadata")
 def load_metadata():
     try:
-        with open("metadata/metadata_list.json", "r") as f:
-            return json.load(f)
+        return job_store.list()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage timings, Gemini calls and tokens, retries, jobs"""
+    telemetry.set_gauge("mcq_jobs_queued", len(job_queue))
+    return PlainTextResponse(telemetry.registry.render(), media_type="text/plain; version=0.0.4")
+
 ########################################## Mount static files ##########################################
 directory = os.path.join(os.path.dirname(__file__), 'static')
 app.mount('/static', StaticFiles(directory=directory), name='static')
 
 ########################################## Ensure uploads directory exists ##########################################
-uploadSave_Directory = os.path.join(os.path.dirname(__file__), 'tempUploads')
-os.makedirs(uploadSave_Directory, exist_ok=True)
+uploadSave_Directory = upload_directory()
+ensure_directories()
+
+# Expired jobs, orphaned uploads, cache entries and Gemini files are removed in the background
+janitor = Janitor(job_store, uploadSave_Directory, cache=ResultCache(), files=RemoteFileRegistry(),
+                  backend_factory=lambda: create_backend(api_key))
 
 @app.get('/')
 async def read_root():
@@ -200,81 +114,362 @@ async def serve_index():
     return FileResponse(os.path.join("static", "index.html"))
 
 ########################################## Upload file ##########################################
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse oversized uploads from the Content-Length header, before the body is read
+    limits = {"/upload": max_upload_bytes, "/bulk": max_bulk_bytes}
+    if request.method == "POST" and request.url.path in limits:
+        limit = limits[request.url.path]
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit + UPLOAD_CHUNK_SIZE:
+            return JSONResponse(content={"detail": f"Upload exceeds the {limit // (1024 * 1024)} MB limit"}, status_code=413)
+    return await call_next(request)
+
+def _write_chunk(buffer, digest, chunk):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+async def save_upload(file: UploadFile, destination: str, max_bytes: int = None):
+    """Stream an upload to disk in fixed-size chunks, hashing it on the way.
+
+    Blocking writes run in the thread pool so the event loop stays free.
+    Returns the SHA-256 of the file, raises 413 past max_bytes (max_upload_bytes by default).
+    """
+    max_bytes = max_bytes or max_upload_bytes
+    digest = hashlib.sha256()
+    size = 0
+    with telemetry.span("upload") as stage:
+        buffer = await run_in_threadpool(open, destination, 'wb')
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+                await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+        except BaseException:
+            await run_in_threadpool(buffer.close)
+            await run_in_threadpool(os.remove, destination)
+            raise
+        await run_in_threadpool(buffer.close)
+        stage["bytes"] = size
+    return digest.hexdigest()
+
 @app.post('/upload')
-async def upload_file( background_tasks: BackgroundTasks, customInput: str = Form(...), file: UploadFile = File(...) ):
-    # clean files older than 24 hours
-    cleanup_files()
+async def upload_file( customInput: str = Form(...), file: UploadFile = File(...), priority: int = Form(0) ):
+    # Refuse new work while the queue is saturated, before storing anything
+    if job_queue.saturated():
+        return JSONResponse(content={"status":0,"message":"Too many jobs waiting, try again later"}, status_code=429, headers={"Retry-After": "30"})
 
     # Check if uploaded file is PDF or DOCX
     if not (file.filename.lower().endswith('.pdf') or file.filename.lower().endswith('.docx')):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
 
+    if file.size is not None and file.size > max_upload_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_upload_bytes // (1024 * 1024)} MB upload limit")
+
     unique_id = str(uuid.uuid4())
     
     # Keep original extension for processing
     original_extension = '.pdf' if file.filename.lower().endswith('.pdf') else '.docx'
     file_name = unique_id + original_extension
     file_location = os.path.join(uploadSave_Directory, file_name ) # file.filename is the name of the file , name is taken from the temporary storage of UploadFile
-    with open(file_location, 'wb') as buffer:
-        buffer.write(file.file.read())
-
-    json_file_name = os.path.join(os.path.dirname(__file__)+"/Outputs/"+unique_id+".json")
+    file_hash = await save_upload(file, file_location)
 
-    metadata = {
-        "uuid": unique_id,
-        "original_filename": file.filename,
-        "pdf_filename": file_name,
-        "json_filename": json_file_name,
-        "status":"Processing",
-        "upload_timestamp":  datetime.now().astimezone().isoformat()
-    }
-    save_metadata(metadata)
+    metadata = job_metadata(unique_id, file.filename, file_location, file_hash, customInput, priority)
+    job_store.add(metadata)
+    job_events.publish(unique_id, status="Queued")
 
-    print("Before adding background task")
-    background_tasks.add_task(process_file, file_location, json_file_name, unique_id, customInput)
-    print("After adding background task")
+    try:
+        position = job_queue.submit(unique_id, priority)
+    except QueueFullError as e:
+        job_store.update_status(unique_id, "Error: Job queue full")
+        job_events.publish(unique_id, status="Error: Job queue full")
+        os.remove(file_location)
+        return JSONResponse(content={"status":0,"message":str(e)}, status_code=429, headers={"Retry-After": "30"})
+    print(f"Job {unique_id} queued at position {position}")
 
     return RedirectResponse(url=f"""metadata/{unique_id}""",status_code=302)
 
+########################################## Bulk upload ##########################################
+async def _store_bulk_file(file: UploadFile, documents: list, rejected: list):
+    """Save one file of a bulk upload, ZIPs are expanded into the documents they hold"""
+    if file.filename.lower().endswith('.zip'):
+        zip_location = os.path.join(uploadSave_Directory, f"{uuid.uuid4()}.zip")
+        await save_upload(file, zip_location, max_bulk_bytes)
+        try:
+            stored, skipped = await run_in_threadpool(
+                expand_zip, zip_location, uploadSave_Directory, max_upload_bytes, max_bulk_files - len(documents)
+            )
+        except zipfile.BadZipFile:
+            stored, skipped = [], [(file.filename, "not a valid ZIP file")]
+        finally:
+            os.remove(zip_location)
+        documents.extend(stored)
+        rejected.extend(skipped)
+    elif not is_supported(file.filename):
+        rejected.append((file.filename, "not a PDF, DOCX or ZIP file"))
+    elif len(documents) >= max_bulk_files:
+        rejected.append((file.filename, f"more than {max_bulk_files} documents in the batch"))
+    else:
+        try:
+            stored = await run_in_threadpool(store_document, file.file, file.filename, uploadSave_Directory, max_upload_bytes)
+        except DocumentTooLargeError as e:
+            rejected.append((file.filename, str(e)))
+            return
+        documents.append((file.filename, *stored))
+
+@app.post('/bulk')
+async def bulk_upload(customInput: str = Form(...), files: List[UploadFile] = File(...), priority: int = Form(0)):
+    """Queue every PDF and DOCX of the uploaded files and ZIPs as one batch"""
+    documents, rejected = [], []
+    for file in files:
+        await _store_bulk_file(file, documents, rejected)
+    if not documents:
+        raise HTTPException(status_code=400, detail="No PDF or DOCX documents in the upload")
+
+    batch_id = new_batch_id()
+    jobs = []
+    for original_filename, unique_id, file_location, file_hash in documents:
+        metadata = job_metadata(unique_id, original_filename, file_location, file_hash, customInput, priority, batch_id)
+        job_store.add(metadata)
+        job_events.publish(unique_id, status="Queued")
+        # Bulk jobs don't count against the queue limit of single uploads
+        job_queue.submit(unique_id, priority, bulk=True)
+        jobs.append({"uuid": unique_id, "original_filename": original_filename})
+    print(f"Batch {batch_id} queued with {len(jobs)} documents")
+
+    return JSONResponse(content={
+        "status": 1,
+        "batch_id": batch_id,
+        "jobs": jobs,
+        "rejected": [{"filename": filename, "reason": reason} for filename, reason in rejected],
+    }, status_code=202)
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Aggregate progress of a bulk batch and the state of each of its documents"""
+    jobs = job_store.list_by_batch(batch_id)
+    if not jobs:
+        return JSONResponse(content={"status":0,"message":"Batch not found"},status_code=404)
+    return JSONResponse(content={"status":1,"batch_id":batch_id,**batch_summary(jobs, job_events.latest)},status_code=200)
+
 @app.get("/metadata/{uuid}")
 async def get_status(uuid: str):
     print("calling metadata function for uuid: ", uuid)
-    metadata_list = load_metadata()
-    metadata = next((item for item in metadata_list if item["uuid"] == uuid), None)
+    metadata = job_store.get(uuid)
     if not metadata:
         return JSONResponse(content={"status":0,"message":"Metadata not found","metadata":[]},status_code=200)
 
+    if metadata["status"] == "Queued":
+        return JSONResponse(content={"status":1,"message":"Waiting in queue","queue_position":job_queue.position(uuid),"metadata":metadata},status_code=200)
+
     if metadata["status"] == "Processing":
         return JSONResponse(content={"status":1,"message":"Processing in progress","metadata":metadata},status_code=200)
     
     # Check if there was an error
-    if metadata["status"].startswith("Error:"):
+    if metadata["status"].startswith("Error:") or metadata["status"] == "Cancelled":
         return JSONResponse(content={"status":2,"message":metadata["status"],"metadata":metadata},status_code=200)
     
     return JSONResponse(content={"status":1,'message': 'File Proccessed Succesfully', 'metadata': metadata}, status_code=200)
 
+def _job_state(uuid: str):
+    """Latest state of a job from the event bus, the job store is read only for jobs the bus hasn't seen"""
+    state = job_events.latest(uuid)
+    if state is None:
+        metadata = job_store.get(uuid)
+        if not metadata:
+            return None
+        job_events.publish(uuid, status=metadata["status"])
+        state = job_events.latest(uuid)
+    if state["status"] == "Queued":
+        state["queue_position"] = job_queue.position(uuid)
+    return state
+
+@app.get("/metadata/{uuid}/wait")
+async def wait_for_status(uuid: str, since: int = 0, timeout: float = 30):
+    """Long-poll: answers as soon as the job's state version is past since, or after timeout seconds"""
+    state = _job_state(uuid)
+    if state is None:
+        return JSONResponse(content={"status":0,"message":"Metadata not found"},status_code=404)
+
+    if state["version"] <= since and not is_finished(state["status"]):
+        await job_events.wait(uuid, since, min(max(timeout, 0), 60))
+        state = _job_state(uuid)
+    return JSONResponse(content={"status":1,"finished":is_finished(state["status"]),"job":state},status_code=200)
+
+async def _status_events(uuid: str, state: dict):
+    while True:
+        yield f"event: status\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+        if is_finished(state["status"]):
+            return
+        version = state["version"]
+        while state["version"] == version:
+            await job_events.wait(uuid, version, 15)
+            state = _job_state(uuid)
+            if state["version"] == version:
+                yield ": keep-alive\n\n"
+
+@app.get("/metadata/{uuid}/events")
+async def status_events(uuid: str):
+    """Server-Sent Events of a job's status and progress, ends once the job has finished"""
+    state = _job_state(uuid)
+    if state is None:
+        return JSONResponse(content={"status":0,"message":"Metadata not found"},status_code=404)
+    return StreamingResponse(_status_events(uuid, state), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/jobs/{uuid}")
+async def cancel_job(uuid: str):
+    metadata = job_store.get(uuid)
+    if not metadata:
+        return JSONResponse(content={"status":0,"message":"Metadata not found"},status_code=404)
+
+    # Pending jobs belong to a command line batch, which skips them once cancelled
+    if job_queue.cancel(uuid) or job_store.transition(uuid, "Pending", "Cancelled"):
+        job_store.update_status(uuid, "Cancelled")
+        job_events.publish(uuid, status="Cancelled")
+        await run_in_threadpool(remove_job_files, storage_path(metadata["file_location"]))
+        return JSONResponse(content={"status":1,"message":"Job removed from queue"},status_code=200)
+
+    # Terminating the job process waits for it to exit, keep that off the event loop
+    if await run_in_threadpool(cancel_running_job, uuid):
+        return JSONResponse(content={"status":1,"message":"Job cancelled"},status_code=200)
+
+    return JSONResponse(content={"status":2,"message":f"Job is not running ({metadata['status']})"},status_code=409)
+
+def _result_response(json_path: str, request: Request, offset: int, limit: int = None):
+    """Serve a stored result: the file on disk streamed for the full list, byte ranges from its index for a page.
+
+    Runs in the thread pool, only results without an index are parsed (once).
+    """
+    index = load_index(json_path)
+    total = len(index["offsets"])
+    paginated = offset > 0 or limit is not None
+    if paginated:
+        encoding = preferred_encoding(request.headers.get("accept-encoding"))
+    else:
+        encoding = stored_encoding(json_path, request.headers.get("accept-encoding"))
+    # Each page and each encoding is its own representation with its own strong ETag
+    tag = index["etag"] + (f"-{offset}-{limit}" if paginated else "") + (f"-{encoding}" if encoding else "")
+    etag = f'"{tag}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if not paginated:
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return FileResponse(json_path + ENCODING_SUFFIXES[encoding], media_type="application/json", headers=headers)
+        # Streamed from the file, a large result is never held in memory
+        f = open(json_path, "rb")
+        headers["Content-Length"] = str(len(FULL_PREFIX) + os.fstat(f.fileno()).st_size + len(FULL_SUFFIX))
+        return StreamingResponse(full_body_chunks(f), media_type="application/json", headers=headers)
+
+    limit = total if limit is None else limit
+    envelope = {"status": 1, "message": "File Processed Succesfully", "total": total, "offset": offset, "limit": limit}
+    body = json.dumps(envelope)[:-1].encode("utf-8") + b',"data":' + read_questions_bytes(json_path, index, offset, limit) + b"}"
+    if encoding and len(body) > MIN_COMPRESS_BYTES:
+        headers["Content-Encoding"] = encoding
+        body = compress(body, encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/json/{uuid}")
-async def get_json(uuid:str):
-    print("getting json data for uuid :" ,uuid)
-    metadata_list=load_metadata()
-    metadata = next((item for item in metadata_list if item["uuid"] == uuid), None)
+async def get_json(uuid: str, request: Request, offset: int = 0, limit: int = None):
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="offset and limit must not be negative")
+    metadata = job_store.get(uuid)
 
     if not metadata:
         return JSONResponse(content={"status":0,"message":"Metadata not found","metadata":[]},status_code=200)
 
     # Check if the file exists
-    if metadata["status"] == "Processing":
+    if not is_finished(metadata["status"]):
         return JSONResponse(content={"status":1,"message":"Processing in progress","data":[]},status_code=200)
     
     # Check if there was an error during processing
-    if metadata["status"].startswith("Error:"):
+    if metadata["status"].startswith("Error:") or metadata["status"] == "Cancelled":
         return JSONResponse(content={"status":2,"message":metadata["status"],"data":[]},status_code=200)
     
-    if not os.path.isfile(metadata["json_filename"]):
-        print(f"❌ File not found: {metadata["json_filename"]}")
+    json_path = storage_path(metadata["json_filename"])
+    if not os.path.isfile(json_path):
+        print(f"❌ File not found: {json_path}")
         return JSONResponse(content={"status":2,"message":"File not found","data":[]},status_code=200)
-    
-    with open(metadata["json_filename"], "r", encoding="utf-8") as f:
-        data = json.load(f)
 
-    return JSONResponse(content={"status":1,'message': 'File Processed Succesfully',"data":data},status_code=200)
+    return await run_in_threadpool(_result_response, json_path, request, offset, limit)
+
+
+def _format_event(event, sse):
+    payload = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+def _open_checkpoint(json_path: str):
+    """The job's checkpoint opened for reading, None while it has none"""
+    try:
+        return open(checkpoint_path(json_path), "rb")
+    except FileNotFoundError:
+        return None
+
+def _result_records(json_path: str):
+    """A finished job's result file as a single batch record"""
+    if not os.path.isfile(json_path):
+        return []
+    with open(json_path, "r", encoding="utf-8") as f:
+        return [{"type": "batch", "pages": None, "questions": json.load(f)}]
+
+async def _stream_questions(uuid: str, sse: bool):
+    """Follow a job's checkpoint and yield its questions as batches finish.
+
+    Questions arrive in batch completion order and duplicates across
+    neighbouring batches are dropped on the way, /json/{uuid} keeps the
+    final page-ordered list. Jobs finished before the stream opened are
+    served from the result file, already deduplicated.
+    """
+    deduplicator = AdjacentBatchDeduplicator()
+    count = 0
+    checkpoint = None
+    try:
+        while True:
+            # The store and the files are read in the threadpool, never on the event loop
+            metadata = await run_in_threadpool(job_store.get, uuid)
+            status = metadata["status"] if metadata else "Error: Metadata not found"
+            finished = is_finished(status)
+            json_path = storage_path(metadata["json_filename"]) if metadata else None
+
+            if checkpoint is None and metadata:
+                # Kept open, the job deletes the file once its result is written
+                checkpoint = await run_in_threadpool(_open_checkpoint, json_path)
+
+            records = []
+            if checkpoint is not None:
+                records = await run_in_threadpool(read_records, checkpoint)
+            elif finished and status.startswith("Processed"):
+                records = await run_in_threadpool(_result_records, json_path)
+
+            for record in records:
+                if record.get("type") != "batch":
+                    continue
+                questions = record["questions"]
+                if record.get("index") is not None:
+                    questions = deduplicator.add_batch(record["index"], questions)
+                for question in questions:
+                    count += 1
+                    yield _format_event({"type": "question", "number": count, "pages": record["pages"], "question": question}, sse)
+
+            if finished:
+                yield _format_event({"type": "done", "status": status, "questions": count}, sse)
+                return
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+@app.get("/json/{uuid}/stream")
+async def stream_json(uuid: str, format: str = "ndjson"):
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+    if not await run_in_threadpool(job_store.get, uuid):
+        return JSONResponse(content={"status":0,"message":"Metadata not found","data":[]},status_code=404)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_questions(uuid, format == "sse"), media_type=media_type, headers={"Cache-Control": "no-cache"})
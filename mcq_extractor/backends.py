@@ -0,0 +1,205 @@
+import os
+import re
+import glob
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
+import google.generativeai as genai
+from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from google.api_core import exceptions as google_exceptions
+
+CHARS_PER_TOKEN = 4
+_PAGE_RANGE_RE = re.compile(r'pages (\d+) through (\d+)')
+
+
+def remote_file_prefix():
+    """Display name prefix of the files this deployment uploads, the janitor only deletes those"""
+    return os.getenv("REMOTE_FILE_PREFIX", "mcq-extractor-")
+
+
+def remote_display_name(path):
+    return remote_file_prefix() + os.path.basename(path)
+
+
+class GeminiBackend:
+    """Model calls through google-generativeai"""
+
+    def __init__(self, api_key):
+        genai.configure(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(
+                    model_name=model_name,
+                    safety_settings={
+                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                    },
+                    generation_config={
+                        "response_mime_type": "application/json"
+                    }
+                )
+            return self._models[model_name]
+
+    def generate_content(self, model_name, parts, timeout):
+        return self._model(model_name).generate_content(parts, request_options={"timeout": timeout})
+
+    def upload_file(self, path):
+        return genai.upload_file(path=path, display_name=remote_display_name(path))
+
+    def file_reference(self, name, uri, mime_type):
+        """Request part pointing at a file uploaded earlier, without fetching it again"""
+        return {"file_data": {"mime_type": mime_type, "file_uri": uri}}
+
+    def list_files(self):
+        return list(genai.list_files())
+
+    def delete_file(self, name):
+        genai.delete_file(name)
+
+
+class FakeBackend:
+    """Offline stand-in for Gemini that replays recorded extraction results.
+
+    Each call answers with questions taken in turn from the result files in
+    responses_dir (Outputs/ by default), questions_per_page for every page of
+    the requested range. Latency, truncated responses, empty candidates and
+    500 errors are injected at the configured rates, so batching, retries and
+    dedup can be measured without an API key. Latency can be set per model,
+    and answers made invalid at a rate, to exercise model routing. Questions repeat once the
+    recorded pool is used up, dedup then drops them like real duplicates.
+    """
+
+    def __init__(self, responses_dir=None, latency_seconds=None, seconds_per_question=None,
+                 truncate_rate=None, empty_rate=None, error_rate=None, questions_per_page=None, seed=None,
+                 model_latency=None, invalid_rate=None):
+        responses_dir = responses_dir or os.getenv("FAKE_RESPONSES_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "Outputs"))
+        self.latency_seconds = latency_seconds if latency_seconds is not None else float(os.getenv("FAKE_LATENCY_SECONDS", "0.5"))
+        self.seconds_per_question = seconds_per_question if seconds_per_question is not None else float(os.getenv("FAKE_SECONDS_PER_QUESTION", "0.02"))
+        self.truncate_rate = truncate_rate if truncate_rate is not None else float(os.getenv("FAKE_TRUNCATE_RATE", "0"))
+        self.empty_rate = empty_rate if empty_rate is not None else float(os.getenv("FAKE_EMPTY_RATE", "0"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("FAKE_ERROR_RATE", "0"))
+        self.questions_per_page = questions_per_page or int(os.getenv("FAKE_QUESTIONS_PER_PAGE", "5"))
+        # Share of calls where one answer letter comes back invalid, which makes the router escalate
+        self.invalid_rate = invalid_rate if invalid_rate is not None else float(os.getenv("FAKE_INVALID_RATE", "0"))
+        # "model=seconds,..." overriding latency_seconds for those models
+        if model_latency is None:
+            model_latency = {}
+            for item in os.getenv("FAKE_MODEL_LATENCY", "").split(","):
+                if "=" in item:
+                    name, seconds = item.split("=", 1)
+                    model_latency[name.strip()] = float(seconds)
+        self.model_latency = model_latency
+        self.pool = self._load_pool(responses_dir)
+        self.calls = 0
+        self.uploads = 0
+        self.files = {}  # Uploaded files by name, as the provider would list them
+        self._next_question = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_pool(responses_dir):
+        pool = []
+        for path in sorted(glob.glob(os.path.join(responses_dir, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    questions = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(questions, list):
+                pool.extend(question for question in questions if isinstance(question, dict))
+        if not pool:
+            pool = [{
+                "SI.No": 1,
+                "question": "<p>Which planet is known as the red planet?</p>",
+                "options": ["Venus", "Mars", "Jupiter", "Mercury"],
+                "correct_answer": "B",
+                "type": "MCQ",
+            }]
+        return pool
+
+    def _draw(self, prompt):
+        """Pick the injected outcome and the questions answering this prompt"""
+        match = _PAGE_RANGE_RE.search(prompt)
+        pages = int(match.group(2)) - int(match.group(1)) + 1 if match else 1
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            questions = []
+            for _ in range(pages * self.questions_per_page):
+                questions.append(dict(self.pool[self._next_question % len(self.pool)]))
+                self._next_question += 1
+            cut = self._random.random()
+            if questions and self._random.random() < self.invalid_rate:
+                questions[0]["correct_answer"] = None
+        return roll, questions, cut
+
+    def generate_content(self, model_name, parts, timeout):
+        prompt = parts[0]
+        roll, questions, cut = self._draw(prompt)
+        delay = self.model_latency.get(model_name, self.latency_seconds) + self.seconds_per_question * len(questions)
+        if delay > timeout:
+            time.sleep(timeout)
+            raise google_exceptions.DeadlineExceeded(f"Fake call exceeded its {timeout}s deadline")
+        time.sleep(delay)
+
+        if roll < self.error_rate:
+            raise google_exceptions.InternalServerError("500 An internal error has occurred (injected)")
+        roll -= self.error_rate
+        if roll < self.empty_rate:
+            return _fake_response("", "OTHER", prompt, parts=[])
+
+        text = json.dumps(questions, ensure_ascii=False)
+        roll -= self.empty_rate
+        if roll < self.truncate_rate:
+            return _fake_response(text[:max(1, int(len(text) * cut))], "MAX_TOKENS", prompt)
+        return _fake_response(text, "STOP", prompt)
+
+    def upload_file(self, path):
+        with self._lock:
+            self.uploads += 1
+        time.sleep(self.latency_seconds)
+        name = f"files/fake-{os.path.basename(path)}"
+        remote_file = SimpleNamespace(name=name, uri=f"fake://{name}", display_name=remote_display_name(path),
+                                      create_time=datetime.now(timezone.utc))
+        with self._lock:
+            self.files[name] = remote_file
+        return remote_file
+
+    def file_reference(self, name, uri, mime_type):
+        return SimpleNamespace(name=name, uri=uri, display_name=name)
+
+    def list_files(self):
+        with self._lock:
+            return list(self.files.values())
+
+    def delete_file(self, name):
+        with self._lock:
+            self.files.pop(name, None)
+
+
+def _fake_response(text, finish_reason, prompt, parts=None):
+    """Object with the parts of a GenerateContentResponse that MCQExtractor reads"""
+    content = SimpleNamespace(parts=[SimpleNamespace(text=text)] if parts is None else parts)
+    candidate = SimpleNamespace(content=content, finish_reason=SimpleNamespace(name=finish_reason))
+    usage = SimpleNamespace(prompt_token_count=len(prompt) // CHARS_PER_TOKEN, candidates_token_count=len(text) // CHARS_PER_TOKEN)
+    return SimpleNamespace(candidates=[candidate], text=text, usage_metadata=usage)
+
+
+def create_backend(api_key, name=None):
+    """Backend named by MODEL_BACKEND: "gemini" (default) or "fake" """
+    name = name or os.getenv("MODEL_BACKEND", "gemini")
+    if name == "fake":
+        return FakeBackend()
+    if name == "gemini":
+        return GeminiBackend(api_key)
+    raise ValueError(f"Unknown model backend: {name}")
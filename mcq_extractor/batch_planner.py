@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+from .prescan import PAGE_SCANNED, is_prose
+
+CHARS_PER_TOKEN = 4
+# The response repeats the page text as JSON with HTML markup
+OUTPUT_TOKENS_PER_TEXT_TOKEN = 1.3
+TOKENS_PER_QUESTION = 60  # JSON keys, type and answer of one question
+SCANNED_PAGE_TOKENS = 1500  # No text layer to measure, assume a full page of questions
+MIN_PAGE_TOKENS = 100
+
+FAILED_OUTCOMES = ("truncated", "empty", "invalid", "server_error", "timeout")
+
+
+class BatchPlanner:
+    """Size batches from an estimate of each page's response tokens.
+
+    Pages are priced from the pre-scan (text length, question markers,
+    scanned pages) and packed into batches that stay under token_budget,
+    so dense pages get small batches and sparse pages large ones.
+
+    The planner learns during the run: failed model calls (truncated, empty,
+    invalid or 500 responses) shrink the budget used for split retries,
+    successful ones calibrate the estimate against the real response size.
+    state() and load_state() carry what was learned over to the next job.
+    """
+
+    def __init__(self, token_budget=None, max_pages=None):
+        self.initial_budget = token_budget or int(os.getenv("BATCH_TOKEN_BUDGET", "12000"))
+        self.max_pages = max_pages or int(os.getenv("MAX_PAGES_PER_BATCH", "20"))
+        self.token_budget = self.initial_budget
+        self.scale = 1.0  # Observed response tokens / estimated tokens
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def page_cost(self, scan):
+        """Estimated response tokens of one page, before calibration"""
+        if scan["kind"] == PAGE_SCANNED:
+            return SCANNED_PAGE_TOKENS
+        text_tokens = scan["text_length"] / CHARS_PER_TOKEN
+        cost = text_tokens * OUTPUT_TOKENS_PER_TEXT_TOKEN + len(scan["question_numbers"]) * TOKENS_PER_QUESTION
+        return max(MIN_PAGE_TOKENS, cost)
+
+    def range_cost(self, page_scans, start_page, end_page):
+        return sum(self.page_cost(scan) for scan in page_scans[start_page - 1:end_page])
+
+    def plan(self, page_scans, runs, budget=None):
+        """Cut each (start_page, end_page) run into batches that fit the budget"""
+        budget = budget or self.token_budget
+        batches = []
+        for run_start, run_end in runs:
+            start_page = run_start
+            cost = previous_cost = 0
+            for page in range(run_start, run_end + 1):
+                page_cost = self.page_cost(page_scans[page - 1]) * self.scale
+                too_expensive = cost and cost + page_cost > budget
+                # A passage is never cut off from the page after it
+                lone_passage = page - 1 == start_page and is_prose(page_scans, start_page)
+                if (too_expensive or page - start_page >= self.max_pages) and not lone_passage:
+                    if page - 1 > start_page and is_prose(page_scans, page - 1):
+                        batches.append((start_page, page - 2))
+                        start_page, cost = page - 1, previous_cost
+                    else:
+                        batches.append((start_page, page - 1))
+                        start_page, cost = page, 0
+                cost += page_cost
+                previous_cost = page_cost
+            batches.append((start_page, run_end))
+        return batches
+
+    def split(self, page_scans, start_page, end_page):
+        """Plan a failed batch again with the current budget, always in at least two parts"""
+        if start_page >= end_page:
+            return [(start_page, end_page)]
+        with self._lock:
+            budget = self.token_budget
+        cost = self.range_cost(page_scans, start_page, end_page) * self.scale
+        parts = self.plan(page_scans, [(start_page, end_page)], budget=min(budget, cost / 2))
+        if len(parts) < 2:
+            middle = (start_page + end_page) // 2
+            parts = [(start_page, middle), (middle + 1, end_page)]
+        return parts
+
+    def record_failure(self, outcome):
+        """A model call failed: shrink the budget for what is planned next"""
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome in FAILED_OUTCOMES and outcome != "timeout":
+                self.token_budget = max(MIN_PAGE_TOKENS, self.token_budget * 0.6)
+
+    def record_success(self, page_scans, start_page, end_page, questions):
+        """A model call succeeded: calibrate the estimate and let the budget grow back"""
+        estimate = self.range_cost(page_scans, start_page, end_page)
+        observed = len(json.dumps(questions, ensure_ascii=False)) / CHARS_PER_TOKEN
+        with self._lock:
+            self.outcomes["ok"] = self.outcomes.get("ok", 0) + 1
+            if estimate:
+                ratio = min(4.0, max(0.25, observed / estimate))
+                self.scale = 0.8 * self.scale + 0.2 * ratio
+            self.token_budget = min(self.initial_budget, self.token_budget * 1.1)
+
+    def state(self):
+        with self._lock:
+            return {"scale": self.scale, "token_budget": self.token_budget}
+
+    def load_state(self, state):
+        if not state:
+            return
+        with self._lock:
+            self.scale = state.get("scale", self.scale)
+            self.token_budget = min(self.initial_budget, state.get("token_budget", self.token_budget))
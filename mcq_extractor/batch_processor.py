@@ -1,20 +1,67 @@
+import os
 import pdfplumber
-from .extractor import MCQExtractor
-import hashlib
-import re
+from .extractor import MCQExtractor, format_questions_to_ignore
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from .cache import ResultCache, file_sha256, page_fingerprints, text_fingerprints
+from .page_slicer import PageSlicer
+from .dedup import AdjacentBatchDeduplicator
+from .prescan import scan_pdf, classify_page_text, extract_answer_keys, page_answers, has_question_pages, plan_question_batches
+from .docx_source import docx_sections, sections_text
+from .local_parser import LocalMCQParser
+from .checkpoint import BatchCheckpoint
+from .batch_planner import BatchPlanner
+from .model_router import ModelRouter
+from . import telemetry
 
 class MCQBatchProcessor:
-    def __init__(self, api_key):
-        self.extractor = MCQExtractor(api_key)
-        self.pages_per_batch = 10
+    def __init__(self, api_key, max_concurrent_batches=None, cache=None, progress=None, backend=None, job_id=None):
+        self.extractor = MCQExtractor(api_key, backend=backend)
+        self.job_id = job_id  # Links the job's remote uploads to it, they are deleted when it expires
+        self.progress = progress  # Optional callable, receives a dict each time the job moves on
+        self.cache = cache if cache is not None else ResultCache()
+        self.pages_per_batch = 10  # Used when pages aren't pre-scanned or adaptive batching is off
         self.max_questions_to_ignore = 10
         self.overlap_pages = 2  # Pages to overlap when splitting batches
+        # Number of batches sent to Gemini at the same time, 1 keeps the sequential mode
+        if max_concurrent_batches is None:
+            max_concurrent_batches = int(os.getenv("BATCH_CONCURRENCY", "4"))
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        # Send each batch as its own sub-PDF instead of the whole document
+        self.slice_pages = os.getenv("PAGE_SLICING", "1") != "0"
+        self.max_inline_bytes = int(os.getenv("INLINE_PDF_MAX_MB", "15")) * 1024 * 1024
+        # Without slicing, start uploading the whole document while its pages are fingerprinted and pre-scanned
+        self.pre_upload = os.getenv("PRE_UPLOAD", "1") != "0"
+        # Word-set Jaccard similarity above which two questions count as duplicates
+        self.dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+        # Classify pages locally and only send the ones holding questions
+        self.prescan_pages = os.getenv("PRESCAN", "1") != "0"
+        # Parse clean text-layer pages locally, only low-confidence ranges go to the model
+        self.local_parser = LocalMCQParser() if os.getenv("LOCAL_PARSER", "1") != "0" else None
+        # Size batches from the pre-scan's per-page cost estimate instead of a fixed page count
+        self.adaptive_batches = os.getenv("ADAPTIVE_BATCHES", "1") != "0"
+        self.planner = BatchPlanner()
+        self.extractor.on_failure = self.planner.record_failure
+        # Fast model first, batches whose results fail validation escalate up MODEL_LADDER
+        self.router = ModelRouter(self.extractor)
 
     def get_total_pages(self, pdf_path):
         with pdfplumber.open(pdf_path) as pdf:
             return len(pdf.pages)
     
-    def process_pdf_in_batches(self, pdf_path, custom_prompt):
+    def plan_batches(self, total_pages):
+        """Return the (start_page, end_page) ranges covering the document"""
+        return [
+            (i + 1, min(i + self.pages_per_batch, total_pages))
+            for i in range(0, total_pages, self.pages_per_batch)
+        ]
+
+    def process_pdf_in_batches(self, pdf_path, custom_prompt, file_hash=None, checkpoint_path=None):
+        """Extract all questions of a PDF.
+
+        With checkpoint_path, every finished batch is appended to that file
+        and batches recorded there by an interrupted run are not extracted again.
+        """
         print(f"\nProcessing PDF: {pdf_path}")
 
         if custom_prompt:
@@ -22,35 +69,274 @@ class MCQBatchProcessor:
         else:
             print("Using default instructions.")
 
-        pdf_file = self.extractor.upload_pdf(pdf_path)
-        total_pages = self.get_total_pages(pdf_path)
-        all_extracted_questions = []
+        file_hash = file_hash or file_sha256(pdf_path)
+        document_key = self.cache.make_key("document", file_hash, self.extractor.routing_key, custom_prompt)
+        cached_questions = self.cache.get(document_key)
+        if cached_questions is not None:
+            print(f"✅ Cache hit for whole document ({len(cached_questions)} questions)")
+            return cached_questions
+
+        pre_upload = None
+        if not self.slice_pages and self.pre_upload:
+            uploader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pre-upload")
+            pre_upload = uploader.submit(self.extractor.upload_pdf, pdf_path, self.job_id)
+            uploader.shutdown(wait=False)
+
+        page_hashes = page_fingerprints(pdf_path)
+        document = self._new_document(pdf_path, page_hashes)
+        document['remote_file'] = pre_upload
+        if self.slice_pages:
+            document['slicer'] = PageSlicer(pdf_path, page_hashes, self.cache.slice_dir)
+
+        if self.prescan_pages:
+            document['page_scans'] = scan_pdf(pdf_path)
+            document['answer_keys'] = extract_answer_keys(document['page_scans'])
+            if self.adaptive_batches:
+                document['planner_key'] = self.cache.make_key("batch-planner", self.extractor.routing_key)
+                self.planner.load_state(self.cache.get(document['planner_key']))
+                runs = plan_question_batches(document['page_scans'], len(page_hashes))
+                batches = self.planner.plan(document['page_scans'], runs)
+            else:
+                batches = plan_question_batches(document['page_scans'], self.pages_per_batch)
+            skipped_pages = len(page_hashes) - sum(end - start + 1 for start, end in batches)
+            print(f"Pre-scan: {skipped_pages} of {len(page_hashes)} pages skipped, {sum(len(answers) for _, _, answers in document['answer_keys'])} answers read from answer keys")
+        else:
+            batches = self.plan_batches(len(page_hashes))
+
+        return self._run_batches(document, batches, custom_prompt, file_hash, document_key, checkpoint_path)
+
+    def process_docx(self, docx_path, custom_prompt, file_hash=None, checkpoint_path=None):
+        """Extract all questions of a DOCX from its text, without rendering or uploading a PDF.
+
+        The paragraphs and tables are grouped into question-aligned sections
+        that take the place of pages, see docx_sections. Batches of sections
+        go to the local parser, or to the model as text.
+        """
+        print(f"\nProcessing DOCX: {docx_path}")
+
+        file_hash = file_hash or file_sha256(docx_path)
+        document_key = self.cache.make_key("document", file_hash, self.extractor.routing_key, custom_prompt)
+        cached_questions = self.cache.get(document_key)
+        if cached_questions is not None:
+            print(f"✅ Cache hit for whole document ({len(cached_questions)} questions)")
+            return cached_questions
+
+        sections = docx_sections(docx_path)
+        if not sections:
+            print("No text found in the DOCX")
+            return []
+
+        document = self._new_document(docx_path, text_fingerprints(sections))
+        document['sections'] = sections
+        document['page_scans'] = []
+        for number, text in enumerate(sections, start=1):
+            scan = classify_page_text(text, False)
+            scan["page"] = number
+            document['page_scans'].append(scan)
+        document['answer_keys'] = extract_answer_keys(document['page_scans'])
+
+        if self.adaptive_batches:
+            # Sections are priced like pages, but text costs are learned apart from PDF ones
+            document['planner_key'] = self.cache.make_key("batch-planner", self.extractor.routing_key, "docx")
+            self.planner.load_state(self.cache.get(document['planner_key']))
+            runs = plan_question_batches(document['page_scans'], len(sections))
+            batches = self.planner.plan(document['page_scans'], runs)
+        else:
+            batches = plan_question_batches(document['page_scans'], self.pages_per_batch)
+        print(f"DOCX: {len(sections)} sections in {len(batches)} batches, {sum(len(answers) for _, _, answers in document['answer_keys'])} answers read from answer keys")
+
+        return self._run_batches(document, batches, custom_prompt, file_hash, document_key, checkpoint_path)
+
+    def _new_document(self, path, page_hashes):
+        """State of one document shared by its batches"""
+        return {
+            'path': path,
+            'page_hashes': page_hashes,
+            'remote_file': None,  # Uploaded on the first batch that misses the cache, or a pre-upload Future
+            'lock': threading.Lock(),
+            'page_scans': None,
+            'answer_keys': [],
+            'sections': None,  # Text per "page" of a DOCX, sent instead of PDF pages
+            'planner_key': None,
+            'checkpoint': None,
+            'finished': {},  # Batch index -> questions restored from the checkpoint
+            'batches_done': 0,
+            'questions_found': 0,
+        }
+
+    def _run_batches(self, document, batches, custom_prompt, file_hash, document_key, checkpoint_path):
+        """Extract the planned batches, resuming from the checkpoint, then merge and cache the result"""
+        if checkpoint_path:
+            document['checkpoint'] = BatchCheckpoint(checkpoint_path)
+            # A resumed job keeps the plan it started with, the planner may have learned since
+            batches = document['checkpoint'].recorded_batches(file_hash, custom_prompt) or batches
+            document['finished'] = document['checkpoint'].resume(file_hash, custom_prompt, batches)
+            if document['finished']:
+                print(f"Resuming from checkpoint: {len(document['finished'])} of {len(batches)} batches already done")
+        document['batches_done'] = len(document['finished'])
+        document['questions_found'] = sum(len(results) for results in document['finished'].values())
+        self._report(document, "extracting", batches)
+
+        if self.max_concurrent_batches > 1 and len(batches) > 1:
+            batch_results = self._process_batches_concurrently(document, batches, custom_prompt)
+        else:
+            batch_results = self._process_batches_sequentially(document, batches, custom_prompt)
+        self._report(document, "merging", batches)
+        if document['planner_key']:
+            self.cache.set(document['planner_key'], self.planner.state())
+            print(f"Batch planner: {len(batches)} batches, outcomes {self.planner.outcomes}, next budget {self.planner.token_budget:.0f} tokens")
+        all_extracted_questions = self._merge_batches(batch_results)
+
+        # Renumber questions sequentially
+        for i, question in enumerate(all_extracted_questions):
+            question['SI.No'] = i + 1
+
+        if all_extracted_questions:
+            self.cache.set(document_key, all_extracted_questions)
+
+        print(f"\nTotal questions extracted: {len(all_extracted_questions)}")
+        return all_extracted_questions
+
+    def _remote_file(self, document):
+        """Upload the document to Gemini once, on first use, or wait for its pre-upload"""
+        with document['lock']:
+            if document['remote_file'] is None:
+                document['remote_file'] = self.extractor.upload_pdf(document['path'], self.job_id)
+            remote_file = document['remote_file']
+        return remote_file.result() if isinstance(remote_file, Future) else remote_file
+
+    def _page_slice(self, document, start_page, end_page):
+        """Cut the batch (plus its lookahead page) into a sub-PDF, inlined when small enough"""
+        slice_path, relative_start, relative_end = document['slicer'].slice(start_page, end_page)
+        if os.path.getsize(slice_path) <= self.max_inline_bytes:
+            pdf_part = self.extractor.inline_pdf(slice_path)
+        else:
+            pdf_part = self.extractor.upload_pdf(slice_path, self.job_id)
+        return pdf_part, relative_start, relative_end
+
+    def _batch_answer_key(self, document, start_page, end_page):
+        """Answers read locally for the question numbers printed on these pages.
+
+        Each page takes its answers from the key that covers it, a number
+        given two different letters across the batch's keys is left out.
+        """
+        if not document['answer_keys'] or not document['page_scans']:
+            return {}
+        answer_key, conflicts = {}, set()
+        for scan in document['page_scans'][start_page - 1:end_page + 1]:
+            answers = page_answers(document['answer_keys'], scan['page'])
+            for number in scan['question_numbers']:
+                if number in answers and answer_key.setdefault(number, answers[number]) != answers[number]:
+                    conflicts.add(number)
+        return {number: letter for number, letter in answer_key.items() if number not in conflicts}
+
+    def _report(self, document, phase, batches, **details):
+        if self.progress is not None:
+            self.progress(dict(
+                phase=phase,
+                batch=document['batches_done'],
+                batches=len(batches),
+                questions=document['questions_found'],
+                **details,
+            ))
+
+    def _record_batch(self, document, index, batches, results):
+        """Append a finished batch to the job's checkpoint, if it has one, and report progress"""
+        if not results:
+            return
+        if document['checkpoint'] is not None:
+            start_page, end_page = batches[index]
+            document['checkpoint'].append(index, start_page, end_page, results)
+        document['batches_done'] += 1
+        document['questions_found'] += len(results)
+        self._report(document, "extracting", batches)
+
+    def _extract_batch(self, document, start_page, end_page, custom_prompt, questions_to_ignore):
+        """Extract one page range, served from the cache when the same pages were seen before"""
+        # The prompt lets Gemini look one page past end_page for broken questions
+        page_hashes = document['page_hashes'][start_page - 1:end_page + 1]
+        answer_key = self._batch_answer_key(document, start_page, end_page)
+        if self.local_parser and document['page_scans']:
+            pages = [(scan['page'], scan['text']) for scan in document['page_scans'][start_page - 1:end_page + 1]]
+            local_results, confidence = self.local_parser.parse_pages(pages, end_page, answer_key)
+            if local_results and confidence >= self.local_parser.min_confidence:
+                print(f"✅ Parsed pages {start_page}-{end_page} locally ({len(local_results)} questions, confidence {confidence:.2f})")
+                telemetry.inc("mcq_batches_total", source="local")
+                return local_results
+            print(f"Local parse confidence {confidence:.2f} for pages {start_page}-{end_page}, using the model")
+
+        batch_key = self.cache.make_key(
+            # The prompt only carries the compact ignore list, so neither does the key
+            "batch", self.extractor.routing_key, custom_prompt, page_hashes, format_questions_to_ignore(questions_to_ignore), answer_key
+        )
+        cached_results = self.cache.get(batch_key)
+        if cached_results is not None:
+            print(f"✅ Cache hit for pages {start_page}-{end_page} ({len(cached_results)} questions)")
+            telemetry.inc("mcq_batches_total", source="cache")
+            return cached_results
+
+        telemetry.inc("mcq_batches_total", source="model")
+        # Without a pre-scan an empty batch can't be told from one that lost its questions
+        expect_questions = bool(document['page_scans']) and has_question_pages(document['page_scans'], start_page, end_page)
+        if document['sections']:
+            # Sections are cut where questions start, no lookahead section is needed
+            text = sections_text(document['sections'][start_page - 1:end_page])
+            print(f"Sending sections {start_page}-{end_page} as text ({len(text)} characters)")
+            batch_results = self.router.extract(
+                text, 1, end_page - start_page + 1, custom_prompt, questions_to_ignore, answer_key=answer_key, pages=f"{start_page}-{end_page}",
+                expect_questions=expect_questions
+            )
+        elif self.slice_pages:
+            pdf_part, relative_start, relative_end = self._page_slice(document, start_page, end_page)
+            print(f"Sending pages {start_page}-{end_page} as a {relative_end - relative_start + 1}-page sub-PDF")
+            batch_results = self.router.extract(
+                pdf_part, relative_start, relative_end, custom_prompt, questions_to_ignore, answer_key=answer_key, pages=f"{start_page}-{end_page}",
+                expect_questions=expect_questions
+            )
+        else:
+            batch_results = self.router.extract(
+                self._remote_file(document), start_page, end_page, custom_prompt, questions_to_ignore, answer_key=answer_key,
+                expect_questions=expect_questions
+            )
+        if batch_results:
+            self.cache.set(batch_key, batch_results)
+            if document['page_scans']:
+                self.planner.record_success(document['page_scans'], start_page, end_page, batch_results)
+        return batch_results
+
+    def _process_batches_sequentially(self, document, batches, custom_prompt):
+        """Process batches one after another, passing each batch's tail as the next ignore list"""
+        batch_results = [None] * len(batches)
         questions_to_ignore = []
         failed_batches = []  # Track failed batches for retry
 
         # First pass: Process all batches
-        for i in range(0, total_pages, self.pages_per_batch):
-            start_page = i + 1
-            end_page = min(i + self.pages_per_batch, total_pages)
+        for index, (start_page, end_page) in enumerate(batches):
+            if index in document['finished']:
+                batch_results[index] = document['finished'][index]
+                questions_to_ignore = batch_results[index][-self.max_questions_to_ignore:]
+                print(f"\nPages {start_page}-{end_page} restored from checkpoint ({len(batch_results[index])} questions)")
+                continue
+
             print(f"\nProcessing pages {start_page}-{end_page}...")
 
             if questions_to_ignore:
                 print(f"Ignoring {len(questions_to_ignore)} questions from the previous batch.")
 
-            batch_results = self.extractor.extract_mcqs_from_pages(
-                pdf_file, start_page, end_page, custom_prompt, questions_to_ignore
+            results = self._extract_batch(
+                document, start_page, end_page, custom_prompt, questions_to_ignore
             )
 
-            if batch_results:
-                all_extracted_questions.extend(batch_results)
-                questions_to_ignore = batch_results[-self.max_questions_to_ignore:]
-                print(f"Extracted {len(batch_results)} questions. Total: {len(all_extracted_questions)}")
+            if results:
+                batch_results[index] = results
+                self._record_batch(document, index, batches, results)
+                questions_to_ignore = results[-self.max_questions_to_ignore:]
+                print(f"Extracted {len(results)} questions.")
             else:
                 print("No questions extracted from this batch.")
                 # Add failed batch to retry list
                 failed_batches.append({
-                    'start_page': start_page,
-                    'end_page': end_page,
+                    'index': index,
                     'questions_to_ignore': questions_to_ignore.copy()
                 })
                 questions_to_ignore = []
@@ -58,42 +344,113 @@ class MCQBatchProcessor:
         # Second pass: Retry failed batches by splitting them
         if failed_batches:
             print(f"\n🔄 Retrying {len(failed_batches)} failed batch(es) with split strategy...")
+            self._report(document, "retrying", batches, failed=len(failed_batches))
             
             for batch_info in failed_batches:
-                start_page = batch_info['start_page']
-                end_page = batch_info['end_page']
-                questions_to_ignore = batch_info['questions_to_ignore']
+                start_page, end_page = batches[batch_info['index']]
                 
                 # Try splitting the failed batch
                 split_results = self._retry_with_split_batch(
-                    pdf_file, start_page, end_page, custom_prompt, questions_to_ignore
+                    document, start_page, end_page, custom_prompt, batch_info['questions_to_ignore']
                 )
                 
                 if split_results:
-                    # Deduplicate questions before adding
-                    deduped_results = self._deduplicate_questions(split_results, all_extracted_questions)
-                    all_extracted_questions.extend(deduped_results)
-                    print(f"✅ Split retry successful! Extracted {len(split_results)} questions ({len(deduped_results)} after dedup) from pages {start_page}-{end_page}")
+                    batch_results[batch_info['index']] = split_results
+                    self._record_batch(document, batch_info['index'], batches, split_results)
+                    print(f"✅ Split retry successful! Extracted {len(split_results)} questions from pages {start_page}-{end_page}")
                 else:
                     print(f"❌ Split retry failed for pages {start_page}-{end_page}")
-        
-        # Renumber questions sequentially
-        for i, question in enumerate(all_extracted_questions):
-            question['SI.No'] = i + 1
 
-        print(f"\nTotal questions extracted: {len(all_extracted_questions)}")
-        return all_extracted_questions
+        return batch_results
+
+    def _process_batches_concurrently(self, document, batches, custom_prompt):
+        """Send all batches at once through a bounded worker pool.
+
+        Batches don't see each other's results, so a question broken across a
+        batch boundary can come back from both sides. _merge_batches removes
+        those duplicates afterwards.
+        """
+        batch_results = [None] * len(batches)
+        for index, results in document['finished'].items():
+            batch_results[index] = results
+        pending = [index for index in range(len(batches)) if index not in document['finished']]
+        print(f"Dispatching {len(pending)} batches with up to {self.max_concurrent_batches} in flight...")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as executor:
+            futures = {
+                executor.submit(self._extract_batch, document, batches[index][0], batches[index][1], custom_prompt, []): index
+                for index in pending
+            }
+            # Collect in completion order so each batch is checkpointed as soon as it is done
+            for future in as_completed(futures):
+                index = futures[future]
+                start_page, end_page = batches[index]
+                try:
+                    batch_results[index] = future.result()
+                except Exception as e:
+                    print(f"❌ Batch {start_page}-{end_page} raised: {e}")
+                    batch_results[index] = []
+                self._record_batch(document, index, batches, batch_results[index])
+                print(f"Pages {start_page}-{end_page}: extracted {len(batch_results[index] or [])} questions.")
+
+            # Second pass: Retry failed batches by splitting them, still in parallel
+            failed_indexes = [index for index, results in enumerate(batch_results) if not results]
+            if failed_indexes:
+                print(f"\n🔄 Retrying {len(failed_indexes)} failed batch(es) with split strategy...")
+                self._report(document, "retrying", batches, failed=len(failed_indexes))
+                retry_futures = {
+                    index: executor.submit(self._retry_with_split_batch, document, batches[index][0], batches[index][1], custom_prompt, [])
+                    for index in failed_indexes
+                }
+                for index, future in retry_futures.items():
+                    start_page, end_page = batches[index]
+                    try:
+                        split_results = future.result()
+                    except Exception as e:
+                        print(f"❌ Split retry raised for pages {start_page}-{end_page}: {e}")
+                        split_results = []
+                    if split_results:
+                        batch_results[index] = split_results
+                        self._record_batch(document, index, batches, split_results)
+                        print(f"✅ Split retry successful! Extracted {len(split_results)} questions from pages {start_page}-{end_page}")
+                    else:
+                        print(f"❌ Split retry failed for pages {start_page}-{end_page}")
+
+        return batch_results
+
+    def _merge_batches(self, batch_results):
+        """Concatenate batch results in page order, dropping near-duplicate questions.
+
+        Duplicates come from overlapping split retries and from questions
+        finished on the lookahead page of the previous batch, so each batch
+        is only compared with itself and the batch before it.
+        """
+        total = sum(len(results or []) for results in batch_results)
+        with telemetry.span("dedup", questions=total) as stage:
+            deduplicator = AdjacentBatchDeduplicator(self.dedup_threshold)
+            merged_questions = []
+            for index, results in enumerate(batch_results):
+                merged_questions.extend(deduplicator.add_batch(index, results))
+            stage["kept"] = len(merged_questions)
+
+        if len(merged_questions) < total:
+            print(f"    Deduplication: {total} -> {len(merged_questions)} questions")
+        return merged_questions
     
-    def _retry_with_split_batch(self, pdf_file, start_page, end_page, custom_prompt, questions_to_ignore):
+    def _retry_with_split_batch(self, document, start_page, end_page, custom_prompt, questions_to_ignore):
         """Retry a failed batch by splitting it into smaller parts with overlap"""
         print(f"\nSplitting failed batch {start_page}-{end_page} into smaller parts...")
+        telemetry.inc("mcq_retries_total", reason="split_batch")
         
         # Calculate split points
         total_pages = end_page - start_page + 1
+        if self.adaptive_batches and document['page_scans'] and total_pages > 1:
+            return self._retry_with_planned_parts(document, start_page, end_page, custom_prompt, questions_to_ignore)
+
         if total_pages <= 3:  # Too small to split meaningfully
             print(f"Batch too small to split ({total_pages} pages). Trying once more as-is.")
-            return self.extractor.extract_mcqs_from_pages(
-                pdf_file, start_page, end_page, custom_prompt, questions_to_ignore
+            return self._extract_batch(
+                document, start_page, end_page, custom_prompt, questions_to_ignore
             )
         
         mid_point = start_page + (total_pages // 2)
@@ -102,8 +459,8 @@ class MCQBatchProcessor:
         first_end = min(mid_point + self.overlap_pages, end_page)
         print(f"  Part 1: pages {start_page}-{first_end}")
         
-        first_half = self.extractor.extract_mcqs_from_pages(
-            pdf_file, start_page, first_end, custom_prompt, questions_to_ignore
+        first_half = self._extract_batch(
+            document, start_page, first_end, custom_prompt, questions_to_ignore
         )
         
         # Second half: mid_point - overlap to end_page
@@ -115,8 +472,8 @@ class MCQBatchProcessor:
         if first_half:
             ignore_for_second.extend(first_half[-self.max_questions_to_ignore:])
         
-        second_half = self.extractor.extract_mcqs_from_pages(
-            pdf_file, second_start, end_page, custom_prompt, ignore_for_second
+        second_half = self._extract_batch(
+            document, second_start, end_page, custom_prompt, ignore_for_second
         )
         
         # Combine results
@@ -130,61 +487,19 @@ class MCQBatchProcessor:
             print(f"    Part 2 extracted: {len(second_half)} questions")
         
         return combined_results
-    
-    def _deduplicate_questions(self, new_questions, existing_questions):
-        """Remove duplicate questions based on question content similarity"""
-        if not new_questions or not existing_questions:
-            return new_questions
-        
-        def normalize_question_text(question_obj):
-            """Extract and normalize question text for comparison"""
-            if not isinstance(question_obj, dict) or 'question' not in question_obj:
-                return ""
-            
-            # Extract text from HTML and normalize
-            text = question_obj['question']
-            # Remove HTML tags
-            text = re.sub(r'<[^>]+>', ' ', text)
-            # Normalize whitespace and convert to lowercase
-            text = re.sub(r'\s+', ' ', text.lower().strip())
-            return text
-        
-        def questions_similar(q1, q2, threshold=0.8):
-            """Check if two questions are similar enough to be considered duplicates"""
-            text1 = normalize_question_text(q1)
-            text2 = normalize_question_text(q2)
-            
-            if not text1 or not text2:
-                return False
-            
-            # Simple similarity check: if 80% of words match
-            words1 = set(text1.split())
-            words2 = set(text2.split())
-            
-            if not words1 or not words2:
-                return False
-            
-            intersection = len(words1.intersection(words2))
-            union = len(words1.union(words2))
-            
-            similarity = intersection / union if union > 0 else 0
-            return similarity >= threshold
-        
-        # Find duplicates
-        deduplicated = []
-        for new_q in new_questions:
-            is_duplicate = False
-            for existing_q in existing_questions:
-                if questions_similar(new_q, existing_q):
-                    print(f"    Removing duplicate question: {normalize_question_text(new_q)[:50]}...")
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                deduplicated.append(new_q)
-        
-        if len(deduplicated) < len(new_questions):
-            print(f"    Deduplication: {len(new_questions)} -> {len(deduplicated)} questions")
-        
-        return deduplicated
-        
\ No newline at end of file
+
+    def _retry_with_planned_parts(self, document, start_page, end_page, custom_prompt, questions_to_ignore):
+        """Split a failed batch with the planner, sized by the budget learned from the failures so far"""
+        parts = self.planner.split(document['page_scans'], start_page, end_page)
+        print(f"  Re-planned into {len(parts)} parts: {', '.join(f'{start}-{end}' for start, end in parts)}")
+
+        combined_results = []
+        ignore_for_part = questions_to_ignore.copy() if questions_to_ignore else []
+        for part_number, (part_start, part_end) in enumerate(parts, start=1):
+            part_results = self._extract_batch(document, part_start, part_end, custom_prompt, ignore_for_part)
+            if part_results:
+                combined_results.extend(part_results)
+                print(f"    Part {part_number} extracted: {len(part_results)} questions")
+                # Each part ignores the tail of the one before it
+                ignore_for_part = (questions_to_ignore or []) + part_results[-self.max_questions_to_ignore:]
+        return combined_results
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import pdfplumber
+
+# Sub-PDFs of PageSlicer live under the cache directory with their own lifecycle
+SLICE_DIRECTORY = "slices"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_fingerprints(pdf_path):
+    """SHA-256 per page of the content streams and embedded images.
+
+    Batch cache keys are built from these, so editing one page of a document
+    only invalidates the batches that contain it.
+    """
+    fingerprints = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            digest = hashlib.sha256()
+            for stream in page.page_obj.contents or []:
+                digest.update(stream.get_data())
+            for image in page.images:
+                stream = image.get("stream")
+                if stream is not None:
+                    digest.update(stream.get_rawdata() or b"")
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def text_fingerprints(texts):
+    """SHA-256 per section of text, the DOCX counterpart of page_fingerprints"""
+    return [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+
+
+class ResultCache:
+    """Persistent on-disk cache of extraction results with TTL and size eviction.
+
+    Page slices under slices/ are not entries: a running job may still send
+    one, so they are only removed once unused for twice the job timeout.
+    """
+
+    def __init__(self, cache_dir=None, ttl_seconds=None, max_bytes=None, slice_idle_seconds=None):
+        self.cache_dir = cache_dir or os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("CACHE_TTL_HOURS", "168")) * 3600
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("CACHE_MAX_MB", "512")) * 1024 * 1024
+        self.slice_dir = os.path.join(self.cache_dir, SLICE_DIRECTORY)
+        # Every job touches a slice when it cuts or reuses it, and ends within its timeout
+        self.slice_idle_seconds = slice_idle_seconds or int(os.getenv("JOB_TIMEOUT_SECONDS", "300")) * 2
+        self.evict_every = 50  # Writes between two eviction scans
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from any JSON-serialisable parts"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if self.ttl_seconds and time.time() - stat.st_mtime > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._remove(path)
+            return None
+
+        # Access time drives the least-recently-used eviction order
+        os.utime(path, (time.time(), stat.st_mtime))
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes_since_evict += 1
+            run_eviction = self._writes_since_evict >= self.evict_every
+            if run_eviction:
+                self._writes_since_evict = 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes, then idle slices"""
+        now = time.time()
+        entries = []
+        total_bytes = 0
+        removed = 0
+        for root, directories, files in os.walk(self.cache_dir):
+            if root == self.cache_dir and SLICE_DIRECTORY in directories:
+                directories.remove(SLICE_DIRECTORY)
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".tmp"):
+                    # Leftover from an interrupted write
+                    if now - stat.st_mtime > 3600:
+                        self._remove(path)
+                    continue
+                if self.ttl_seconds and now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                    removed += 1
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total_bytes += stat.st_size
+
+        if self.max_bytes and total_bytes > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total_bytes <= self.max_bytes:
+                    break
+                self._remove(path)
+                total_bytes -= size
+                removed += 1
+
+        removed += self._evict_slices(now)
+        if removed:
+            print(f"Cache eviction removed {removed} entries")
+        return removed
+
+    def _evict_slices(self, now):
+        """Remove the slices no job has used for slice_idle_seconds"""
+        removed = 0
+        try:
+            entries = list(os.scandir(self.slice_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - max(stat.st_atime, stat.st_mtime) > self.slice_idle_seconds:
+                self._remove(entry.path)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
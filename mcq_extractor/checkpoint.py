@@ -0,0 +1,89 @@
+import os
+import json
+import threading
+
+
+def checkpoint_path(result_path):
+    """Checkpoint file kept next to a job's result file"""
+    return os.path.splitext(result_path)[0] + ".ndjson"
+
+
+def read_records(handle):
+    """Read the complete records appended since the last call.
+
+    handle is a binary file object left open between calls. A line still
+    being written has no trailing newline yet, it is left for the next call.
+    """
+    records = []
+    while True:
+        position = handle.tell()
+        line = handle.readline()
+        if not line:
+            break
+        if not line.endswith(b"\n"):
+            handle.seek(position)
+            break
+        records.append(json.loads(line))
+    return records
+
+
+class BatchCheckpoint:
+    """Append-only NDJSON record of the batches a job has finished.
+
+    The first line describes the job (document hash, prompt and batch plan),
+    every following line holds the questions of one finished batch. A job
+    that runs again with the same header skips the batches already recorded,
+    a different header starts the file over. Lines are flushed as soon as a
+    batch finishes, so /json/{uuid}/stream can follow the file while the job
+    runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def resume(self, file_hash, custom_prompt, batches):
+        """Return {batch index: questions} already finished, and start recording"""
+        header = {
+            "type": "header",
+            "document": file_hash,
+            "prompt": custom_prompt,
+            "batches": [list(batch) for batch in batches],
+        }
+        finished = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "rb") as f:
+                records = read_records(f)
+            if records and records[0] == header:
+                for record in records[1:]:
+                    if record.get("type") == "batch":
+                        finished[record["index"]] = record["questions"]
+                return finished
+
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        return finished
+
+    def recorded_batches(self, file_hash, custom_prompt):
+        """Batch plan of an interrupted run of the same document and prompt, or None"""
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            records = read_records(f)
+        if not records or records[0].get("document") != file_hash or records[0].get("prompt") != custom_prompt:
+            return None
+        return [tuple(batch) for batch in records[0]["batches"]]
+
+    def append(self, index, start_page, end_page, questions):
+        """Record a finished batch, safe to call from several threads"""
+        record = {"type": "batch", "index": index, "pages": [start_page, end_page], "questions": questions}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
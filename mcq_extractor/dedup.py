@@ -0,0 +1,158 @@
+import os
+import re
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+# "Which is NOT a prime" and "Which is a prime" are two questions, however similar their words
+_POLARITY_WORDS = frozenset("not no never except incorrect false untrue wrong least cannot".split())
+
+
+def normalize_question_text(question_obj):
+    """Extract and normalize question text for comparison"""
+    if not isinstance(question_obj, dict) or 'question' not in question_obj:
+        return ""
+
+    # Remove HTML tags, normalize whitespace and convert to lowercase
+    text = _TAG_RE.sub(' ', str(question_obj['question']))
+    return _SPACE_RE.sub(' ', text.lower().strip())
+
+
+def _normalize_option(option):
+    return _SPACE_RE.sub(' ', _TAG_RE.sub(' ', str(option)).lower()).strip()
+
+
+def question_features(question_obj):
+    """Word set and word-bigram shingles of a question's stem, and its normalized options.
+
+    Similarity is the Jaccard index of the stem word sets. Options are not
+    part of it: papers reuse option sets across different questions, so two
+    questions only match when their options are the same. The shingles only
+    feed the MinHash: common words like "the" or "which" appear in nearly
+    every question, word pairs are far more selective.
+    """
+    text = normalize_question_text(question_obj)
+    if not text:
+        return frozenset(), frozenset(), ()
+    options = question_obj.get('options') or []
+    options = tuple(_normalize_option(option) for option in options) if isinstance(options, list) else ()
+    words = text.split()
+    shingles = frozenset(zip(words, words[1:])) or frozenset(words)
+    return frozenset(words), shingles, options
+
+
+class QuestionIndex:
+    """Near-duplicate index over extracted questions.
+
+    Each question is normalised and MinHashed once when added. Signatures
+    are cut into bands and bucketed (LSH), so a lookup only compares the
+    question with the few candidates sharing a bucket. Candidates are then
+    confirmed with the exact Jaccard similarity of their stem word sets, and
+    must have the same options.
+
+    The MinHash uses one-permutation hashing: every shingle is hashed once and
+    falls into one of num_perm bins, empty bins borrow from their neighbour.
+    Signatures cost O(words) instead of O(words * num_perm).
+    """
+
+    def __init__(self, threshold=None, num_perm=32, bands=8):
+        self.threshold = threshold if threshold is not None else float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+        self.num_perm = num_perm
+        self.rows = num_perm // bands
+        self.bands = bands
+        self._buckets = {}
+        self._exact = {}
+        self._entries = []  # (token set, options, question) per indexed question
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _signature(self, shingles):
+        # hash() is stable for the process lifetime, which is all the index needs
+        num_bins = self.num_perm
+        bins = [None] * num_bins
+        for shingle in shingles:
+            value = hash(shingle) & 0xFFFFFFFFFFFFFFFF
+            bin_index = value % num_bins
+            if bins[bin_index] is None or value < bins[bin_index]:
+                bins[bin_index] = value
+
+        # Rotation densification: an empty bin takes the next non-empty bin's value,
+        # offset by the distance so that it can't collide with that bin itself
+        signature = list(bins)
+        for bin_index in range(num_bins):
+            if bins[bin_index] is None:
+                distance = 1
+                while bins[(bin_index + distance) % num_bins] is None:
+                    distance += 1
+                signature[bin_index] = (bins[(bin_index + distance) % num_bins], distance)
+        return signature
+
+    def _band_keys(self, signature):
+        return [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def find_duplicate(self, question):
+        """Return an indexed question similar to this one, or None"""
+        return self._lookup(*question_features(question))[0]
+
+    def _lookup(self, tokens, shingles, options):
+        if not tokens:
+            return None, None
+        if (tokens, options) in self._exact:
+            return self._exact[(tokens, options)], None
+
+        band_keys = self._band_keys(self._signature(shingles))
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(self._buckets.get(band_key, ()))
+        for entry_index in sorted(candidates):
+            other_tokens, other_options, other_question = self._entries[entry_index]
+            if other_options != options or (tokens ^ other_tokens) & _POLARITY_WORDS:
+                continue
+            similarity = len(tokens & other_tokens) / len(tokens | other_tokens)
+            if similarity >= self.threshold:
+                return other_question, band_keys
+        return None, band_keys
+
+    def add(self, question):
+        """Index a question unless it duplicates one already indexed.
+
+        Returns True when the question was added, False for a duplicate.
+        Questions without text are always kept and never matched.
+        """
+        tokens, shingles, options = question_features(question)
+        duplicate, band_keys = self._lookup(tokens, shingles, options)
+        if duplicate is not None:
+            return False
+        if tokens:
+            entry_index = len(self._entries)
+            self._entries.append((tokens, options, question))
+            self._exact[(tokens, options)] = question
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(entry_index)
+        return True
+
+
+class AdjacentBatchDeduplicator:
+    """Drop the questions a batch repeats from itself or from its neighbouring batches.
+
+    Duplicates only come from overlaps: the lookahead page a batch shares
+    with the next one, and the overlapping parts of a split retry, which
+    end up in the same batch. Questions further apart are never compared,
+    a paper may well ask the same thing twice. Batches can be added in any
+    order (the stream sees them as they finish), each is compared with the
+    neighbours added before it.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+        self._kept = {}  # Batch index -> questions kept
+
+    def add_batch(self, index, questions):
+        """Return the questions of batch index that are not duplicates"""
+        seen = QuestionIndex(self.threshold)
+        for neighbour in (index - 1, index + 1):
+            for question in self._kept.get(neighbour, ()):
+                seen.add(question)
+        kept = [question for question in questions or [] if seen.add(question)]
+        self._kept[index] = kept
+        return kept
@@ -0,0 +1,68 @@
+import os
+import re
+from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from docx.oxml.ns import qn
+
+# Same question-number marker the pre-scan counts
+_QUESTION_START_RE = re.compile(r'^\s*(?:Q(?:uestion)?\.?\s*)?\d{1,4}\s*[.)]\s*\S', re.IGNORECASE)
+_ANSWER_HEADING_RE = re.compile(r'^\W*(answer\s*key|answers|key\s*to\s*questions|solutions)\W*$', re.IGNORECASE)
+
+
+def iter_docx_blocks(docx_path):
+    """Text of the body's paragraphs and tables, in document order.
+
+    Tables are flattened to one line per row with " | " between cells, so
+    match-the-column lists survive as text. Empty paragraphs are skipped.
+    """
+    document = Document(docx_path)
+    for child in document.element.body.iterchildren():
+        if child.tag == qn("w:p"):
+            text = Paragraph(child, document).text.strip()
+            if text:
+                yield text
+        elif child.tag == qn("w:tbl"):
+            rows = []
+            for row in Table(child, document).rows:
+                cells = []
+                for cell in row.cells:
+                    # Merged cells repeat in python-docx, keep one copy
+                    text = " ".join(cell.text.split())
+                    if not cells or cells[-1] != text:
+                        cells.append(text)
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            if rows:
+                yield "\n".join(rows)
+
+
+def docx_sections(docx_path, max_blocks=None):
+    """Group the DOCX into sections of at most max_blocks paragraphs and tables.
+
+    A full section is only closed where the next question starts, so a
+    question and its options stay together, and an answer key heading
+    always starts a new one. Sections stand in for pages:
+    the pre-scan, the batch planner and the checkpoint work on them as if
+    they were pages of a PDF.
+    """
+    max_blocks = max_blocks or int(os.getenv("DOCX_SECTION_PARAGRAPHS", "40"))
+    sections = []
+    current = []
+    for block in iter_docx_blocks(docx_path):
+        starts_question = bool(_QUESTION_START_RE.match(block))
+        # An answer key gets sections of its own, the pre-scan then reads it and skips it
+        starts_answer_key = bool(_ANSWER_HEADING_RE.match(block))
+        # Without question numbers to cut at, cut anyway at twice the size
+        if current and (starts_answer_key or len(current) >= max_blocks * 2 or (len(current) >= max_blocks and starts_question)):
+            sections.append("\n".join(current))
+            current = []
+        current.append(block)
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def sections_text(sections):
+    """Sections as one text part, each headed as a page numbered from 1 so that a prompt's page range applies"""
+    return "\n\n".join(f"--- Page {page} ---\n{text}" for page, text in enumerate(sections, start=1))
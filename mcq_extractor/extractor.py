@@ -1,41 +1,30 @@
 import os
 import json
 import time
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-import signal
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import string
+from google.api_core import exceptions as google_exceptions
+from . import telemetry
+from .backends import create_backend
+from .model_client import ModelClient, CircuitOpenError, backoff_delay
+from .file_registry import RemoteFileRegistry
+from .cache import file_sha256
+from .json_salvage import salvage_json_array, is_valid_question
+from .dedup import normalize_question_text
 
-class MCQExtractor:
-    def __init__(self, api_key):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro",
-            safety_settings={
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            },
-            generation_config={
-                "response_mime_type": "application/json"
-            }
-        )
-
-    def upload_pdf(self, pdf_path):
-        print(f"Uploading file: {pdf_path}")
-        pdf_file = genai.upload_file(path=pdf_path, display_name=os.path.basename(pdf_path))
-        print(f"Completed upload: {pdf_file.uri}")
-        return pdf_file
+MAX_IGNORED_QUESTIONS = 10
+IGNORE_STEM_CHARS = int(os.getenv("IGNORE_STEM_CHARS", "80"))
 
-    def extract_mcqs_from_pages(self, pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt=0, max_attempts=2):
+PDF_SOURCE = "the attached PDF document"
+TEXT_SOURCE = 'the document text below, each page starts with a "--- Page N ---" line'
 
-        prompt = f"""
+# The instructions are the same for every call, only these fields change.
+# The template is split into its literal text and fields once, at import.
+PROMPT_TEMPLATE = """
         You are an MCQ extractor.
 
         My assessment is that the high concentration of legal, political, and administrative terms, especially those related to minority rights and government authority, is likely triggering these safety filters. While the content is perfectly legitimate and academic, the AI's safety system may be erring on the side of caution and blocking the response to avoid generating content that could be misconstrued as sensitive political commentary.
 
-      Process only pages {start_page} through {end_page} of the attached PDF document.
+      Process only pages {start_page} through {end_page} of {source}.
       Extract all multiple-choice questions from this page range and return them as a JSON array.
       Also, look for an answer key section within this page range and use it to determine the correct answers.
       
@@ -51,8 +40,7 @@ class MCQExtractor:
 
             example : 
             [
-               {
-                    {
+                {{
                     "SI.No": 13,
                     "question": "<p>A pilot is used to land on wide runways only. When approaching a smaller and/ or narrower runway, the pilot may feel he is at:</p>",
                     "options": [
@@ -62,8 +50,7 @@ class MCQExtractor:
                     ],
                     "correct_answer": "A",
                     "type": "MCQ"
-                    }
-                }
+                }}
             ]
    
       Important formatting notes:
@@ -80,39 +67,167 @@ class MCQExtractor:
             - Pattern to Ignore: An "Answer Key" or "Solutions" section is typically characterized by a list format (e.g., 1. C, 2. A) followed by explanations, but it lacks the full, original question text and the list of options (A, B, C, D). If you encounter text that matches this pattern, you must ignore it to prevent creating fragmented or duplicate questions.
       - if any questions happen to repeat , ignore it , (only ignore the questions with same purpose, not similar)
       
-      Questions to ignore (if any):
-      {questions_to_ignore}
+      Questions to ignore (if any), one per line as the question number and the start of its text:
+{questions_to_ignore}
 
       These questions should not be reprocessed.
 
       Now, process the document provided and extract the questions.
         """
+_PROMPT_PARTS = tuple(string.Formatter().parse(PROMPT_TEMPLATE))
+
+
+def render_prompt(**fields):
+    """Fill the precompiled prompt template"""
+    return "".join(literal + (str(fields[name]) if name is not None else "") for literal, name, _, _ in _PROMPT_PARTS)
+
+
+def ignore_entry(question, stem_chars=None):
+    """Question number and the start of its normalized text, enough for the model to recognize it"""
+    stem_chars = stem_chars or IGNORE_STEM_CHARS
+    stem = normalize_question_text(question)
+    if len(stem) > stem_chars:
+        stem = stem[:stem_chars].rsplit(" ", 1)[0] + "…"
+    number = question.get("SI.No", "?") if isinstance(question, dict) else "?"
+    return f"{number}. {stem}"
+
+
+def format_questions_to_ignore(questions):
+    """Compact ignore list for the prompt, one line per question, instead of the full question objects"""
+    if not questions:
+        return "      None"
+    return "\n".join("      - " + ignore_entry(question) for question in questions)
+
+
+class MCQExtractor:
+    def __init__(self, api_key, backend=None):
+        # Gemini by default, MODEL_BACKEND=fake replays recorded results offline
+        self.backend = backend or create_backend(api_key)
+        # Shared quota, backoff and circuit breaker in front of the backend
+        self.client = ModelClient(self.backend)
+        # Deadline of each generate_content call, enforced by the client itself
+        self.call_timeout_seconds = int(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "120"))
+        # Models tried in turn by ModelRouter, the last one is the most capable and the default
+        self.model_ladder = [name.strip() for name in os.getenv("MODEL_LADDER", "gemini-2.5-flash,gemini-2.5-pro").split(",") if name.strip()]
+        self.model_name = self.model_ladder[-1]
+        # What results depend on, for cache keys: the whole ladder, not only the last model
+        self.routing_key = ",".join(self.model_ladder)
+        # Optional callable told about each failed call ("truncated", "empty", "invalid", "server_error", "timeout")
+        self.on_failure = None
+        # Follow-up calls for the rest of a page range after a cut-off response
+        self.max_continuations = int(os.getenv("MAX_CONTINUATIONS", "3"))
+        # Remote uploads by content hash, shared by every job on the host
+        self.files = RemoteFileRegistry()
+
+    def upload_pdf(self, pdf_path, job_id=None):
+        """Upload a PDF, or reuse the remote file holding the same bytes while it stays valid"""
+        file_hash = file_sha256(pdf_path)
+        entry = self.files.lookup(file_hash)
+        if entry is not None:
+            pdf_file = self.backend.file_reference(entry["name"], entry["uri"], entry["mime_type"])
+            print(f"Reusing upload {entry['name']} for {pdf_path}")
+            telemetry.inc("mcq_remote_files_total", outcome="reused")
+        else:
+            print(f"Uploading file: {pdf_path}")
+            with telemetry.span("gemini_upload", bytes=os.path.getsize(pdf_path)):
+                pdf_file = self.backend.upload_file(pdf_path)
+            self.files.record(file_hash, pdf_file)
+            print(f"Completed upload: {pdf_file.uri}")
+            telemetry.inc("mcq_remote_files_total", outcome="uploaded")
+        if job_id:
+            # Deleted remotely once every job that used it has expired
+            self.files.link(file_hash, job_id)
+        return pdf_file
+
+    def inline_pdf(self, pdf_path):
+        """Attach a small PDF directly to the request instead of uploading it"""
+        with open(pdf_path, "rb") as f:
+            return {"mime_type": "application/pdf", "data": f.read()}
+
+    def _report_failure(self, outcome, model_name):
+        telemetry.inc("mcq_gemini_calls_total", outcome=outcome, model=model_name)
+        if self.on_failure is not None:
+            self.on_failure(outcome)
+
+    def _record_usage(self, response, model_name):
+        """Count the call's prompt and response tokens, returns them for the span log"""
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        telemetry.inc("mcq_gemini_tokens_total", prompt_tokens, kind="prompt", model=model_name)
+        telemetry.inc("mcq_gemini_tokens_total", response_tokens, kind="response", model=model_name)
+        return {"prompt_tokens": prompt_tokens, "response_tokens": response_tokens}
+
+    @staticmethod
+    def _finish_reason(response):
+        if not response.candidates:
+            return "Unknown"
+        finish_reason = response.candidates[0].finish_reason
+        return getattr(finish_reason, "name", str(finish_reason))
+
+    def _continue_after(self, pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, salvaged, answer_key, continuation, model_name):
+        """Ask for the questions that come after the last one salvaged from a cut-off response"""
+        print(f"Recovered {len(salvaged)} complete questions from the cut-off response for pages {start_page}-{end_page}, asking for the rest")
+        telemetry.inc("mcq_salvaged_questions_total", len(salvaged))
+        telemetry.inc("mcq_retries_total", reason="continuation")
+        ignore = (list(questions_to_ignore or []) + salvaged)[-MAX_IGNORED_QUESTIONS:]
+        rest = self.extract_mcqs_from_pages(
+            pdf_file, start_page, end_page, custom_prompt, ignore,
+            answer_key=answer_key, resume_after=salvaged[-1], continuation=continuation + 1, model_name=model_name
+        )
+        return salvaged + (rest if isinstance(rest, list) else [])
+
+    def extract_mcqs_from_pages(self, pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt=0, max_attempts=2, answer_key=None,
+                                resume_after=None, continuation=0, model_name=None):
+        model_name = model_name or self.model_name
+
+        # pdf_file is an uploaded file, an inline PDF, or the document's text from a DOCX
+        source = TEXT_SOURCE if isinstance(pdf_file, str) else PDF_SOURCE
+        prompt = render_prompt(
+            start_page=start_page, end_page=end_page, source=source, questions_to_ignore=format_questions_to_ignore(questions_to_ignore)
+        )
+
+        if answer_key:
+            # Answer-key pages found by the local pre-scan are not sent, so pass their entries along
+            prompt += "\n\tAnswers from the document's answer key (question number: answer), use them for these questions:\n\t"
+            prompt += ", ".join(f"{number}: {letter}" for number, letter in sorted(answer_key.items())) + "\n"
+
+        if resume_after:
+            # Continuation of a response that was cut off, only the questions after this one are missing
+            prompt += "\n\tAn earlier answer for these pages was cut off. The questions up to and including this one are already extracted:\n\t"
+            prompt += ignore_entry(resume_after)
+            prompt += "\n\tReturn only the questions that come after it in this page range.\n"
 
         extend_prompt_with="\n\tHere are some additional rules to follow:\n"
         if custom_prompt != "":
             extend_prompt_with += custom_prompt
             prompt += extend_prompt_with
          
-        print(f"Sending request to Gemini API for pages {start_page}-{end_page}...")
+        print(f"Sending request to {model_name} for pages {start_page}-{end_page}...")
         try:
-            # Use timeout for API calls
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(self.model.generate_content, [prompt, pdf_file])
+            with telemetry.span("generate_content", model=model_name, pages=f"{start_page}-{end_page}", attempt=attempt) as call:
                 try:
-                    response = future.result(timeout=120)  # 2 minute timeout for each API call
-                except TimeoutError:
-                    print(f"❌ API timeout after 120 seconds for pages {start_page}-{end_page}")
+                    response = self.client.generate_content(
+                        model_name, [prompt, pdf_file], self.call_timeout_seconds, pages=end_page - start_page + 1
+                    )
+                except google_exceptions.DeadlineExceeded:
+                    print(f"❌ API timeout after {self.call_timeout_seconds} seconds for pages {start_page}-{end_page}")
+                    call["outcome"] = "timeout"
+                    self._report_failure("timeout", model_name)
                     return []
-            print("\n\t\tResponse received from Gemini API.\n")
-            print(response)
-            print("\n\t\tResponse end from Gemini API.\n")
+                call.update(self._record_usage(response, model_name), finish_reason=self._finish_reason(response))
+            print(f"Response received from {model_name} for pages {start_page}-{end_page}")
             
             # Check if response has content parts
             if not response.candidates or not response.candidates[0].content.parts:
-                print(f"Empty response received. Finish reason: {response.candidates[0].finish_reason if response.candidates else 'Unknown'}")
+                print(f"Empty response received. Finish reason: {self._finish_reason(response)}")
+                self._report_failure("truncated" if self._finish_reason(response) == "MAX_TOKENS" else "empty", model_name)
                 if attempt < max_attempts - 1:
                     print(f"Retrying API call after empty response. Attempt {attempt + 2}/{max_attempts}")
-                    return self.extract_mcqs_from_pages(pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt + 1, max_attempts)
+                    telemetry.inc("mcq_retries_total", reason="empty_response")
+                    time.sleep(backoff_delay(attempt))
+                    return self.extract_mcqs_from_pages(pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt + 1, max_attempts, answer_key=answer_key,
+                                                        resume_after=resume_after, continuation=continuation, model_name=model_name)
                 return []
             
             raw_json_string = response.text.strip()
@@ -125,22 +240,37 @@ class MCQExtractor:
 
             # Parse JSON to validate
             try:
-                parsed_json = json.loads(raw_json_string)
+                with telemetry.span("json_parse", characters=len(raw_json_string)):
+                    parsed_json = json.loads(raw_json_string)
+                telemetry.inc("mcq_gemini_calls_total", outcome="ok", model=model_name)
                 return parsed_json
             except json.JSONDecodeError as e:
                 print(f"JSON parsing error: {e}")
+                self._report_failure("truncated" if self._finish_reason(response) == "MAX_TOKENS" else "invalid", model_name)
+                # Keep the complete questions before the cut and only ask for what is missing
+                salvaged = [item for item in salvage_json_array(raw_json_string) if is_valid_question(item)]
+                if salvaged and continuation < self.max_continuations:
+                    return self._continue_after(pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, salvaged, answer_key, continuation, model_name)
+                if salvaged:
+                    print(f"Keeping {len(salvaged)} questions recovered from the cut-off response, continuation limit reached")
+                    telemetry.inc("mcq_salvaged_questions_total", len(salvaged))
+                    return salvaged
                 if attempt < max_attempts - 1:
                     print(f"Retrying API call after parsing error. Attempt {attempt + 2}/{max_attempts}")
-                    return self.extract_mcqs_from_pages(pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt + 1, max_attempts)
+                    telemetry.inc("mcq_retries_total", reason="invalid_json")
+                    time.sleep(backoff_delay(attempt))
+                    return self.extract_mcqs_from_pages(pdf_file, start_page, end_page, custom_prompt, questions_to_ignore, attempt + 1, max_attempts, answer_key=answer_key,
+                                                        resume_after=resume_after, continuation=continuation, model_name=model_name)
 
 
                 return []
 
-        except Exception as e:
-            print(f"Error during MCQ extraction: {e} , Attempting in two batches")
-
-            if "500" in str(e) and attempt == 0 and start_page < end_page:
-                print(f"Context too long error detected. Splitting batch into smaller chunks...")
+        except google_exceptions.InternalServerError as e:
+            print(f"Server error during MCQ extraction: {e}")
+            self._report_failure("server_error", model_name)
+            if attempt == 0 and start_page < end_page:
+                print(f"Splitting pages {start_page}-{end_page} into two batches...")
+                telemetry.inc("mcq_retries_total", reason="server_error_split")
                 
                 # Calculate midpoint for splitting
                 mid_page = start_page + (end_page - start_page) // 2
@@ -148,13 +278,13 @@ class MCQExtractor:
                 # Process first half
                 print(f"Processing first half: pages {start_page}-{mid_page}")
                 first_half = self.extract_mcqs_from_pages(
-                    pdf_file, start_page, mid_page, custom_prompt, questions_to_ignore, 1
+                    pdf_file, start_page, mid_page, custom_prompt, questions_to_ignore, 1, answer_key=answer_key, model_name=model_name
                 )
                 
                 # Process second half
                 print(f"Processing second half: pages {mid_page + 1}-{end_page}")
                 second_half = self.extract_mcqs_from_pages(
-                    pdf_file, mid_page + 1, end_page, custom_prompt, questions_to_ignore, 1
+                    pdf_file, mid_page + 1, end_page, custom_prompt, questions_to_ignore, 1, answer_key=answer_key, model_name=model_name
                 )
                 
                 # Combine results
@@ -167,4 +297,15 @@ class MCQExtractor:
                 print(f"Successfully combined {len(combined_results)} questions from split batches")
                 return combined_results
 
+            return []
+
+        except (CircuitOpenError, google_exceptions.ResourceExhausted) as e:
+            # Smaller batches would hit the same quota or open breaker, so don't split
+            print(f"❌ {model_name} unavailable for pages {start_page}-{end_page}: {e}")
+            self._report_failure("circuit_open" if isinstance(e, CircuitOpenError) else "quota", model_name)
+            return []
+
+        except Exception as e:
+            print(f"Error during MCQ extraction: {e}")
+            self._report_failure("error", model_name)
             return []
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import threading
+
+DEFAULT_REMOTE_FILE_STORE = "metadata/remote_files.db"
+DEFAULT_FILE_LIFETIME_SECONDS = 47 * 3600  # Gemini deletes uploads after 48 hours
+
+
+class RemoteFileRegistry:
+    """Files uploaded to the model provider, by SHA-256 of their bytes.
+
+    A job that needs a PDF whose bytes were uploaded before, by itself or
+    any other job on the host, gets the existing remote file as long as it
+    has at least min_ttl_seconds left; otherwise the file is uploaded again
+    and the entry refreshed. Every job that used a file is linked to it,
+    release_jobs() returns the files no remaining job uses once the janitor
+    expires those jobs. Lives in SQLite like SharedLimits, so the job
+    subprocesses share it.
+    """
+
+    def __init__(self, path=None, min_ttl_seconds=None):
+        self.path = path or os.getenv("REMOTE_FILE_STORE", DEFAULT_REMOTE_FILE_STORE)
+        # A reused file must outlive the job that reuses it
+        self.min_ttl_seconds = min_ttl_seconds if min_ttl_seconds is not None else int(os.getenv("JOB_TIMEOUT_SECONDS", "300")) * 2
+        self._local = threading.local()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS remote_files (
+                sha256 TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS remote_file_jobs (
+                sha256 TEXT NOT NULL,
+                job TEXT NOT NULL,
+                PRIMARY KEY (sha256, job)
+            );
+            CREATE INDEX IF NOT EXISTS idx_remote_file_jobs_job ON remote_file_jobs(job);
+        """)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def lookup(self, sha256):
+        """The entry of a file still valid for min_ttl_seconds, None when it must be uploaded"""
+        row = self._connection().execute(
+            "SELECT name, uri, mime_type, expires FROM remote_files WHERE sha256 = ? AND expires > ?",
+            (sha256, time.time() + self.min_ttl_seconds),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, sha256, remote_file, mime_type="application/pdf"):
+        """Save a new upload, replacing the entry of an older one"""
+        expiration = getattr(remote_file, "expiration_time", None)
+        expires = expiration.timestamp() if expiration is not None else time.time() + DEFAULT_FILE_LIFETIME_SECONDS
+        self._connection().execute(
+            "INSERT OR REPLACE INTO remote_files (sha256, name, uri, mime_type, expires) VALUES (?, ?, ?, ?, ?)",
+            (sha256, remote_file.name, remote_file.uri, getattr(remote_file, "mime_type", None) or mime_type, expires),
+        )
+
+    def link(self, sha256, job):
+        self._connection().execute(
+            "INSERT OR IGNORE INTO remote_file_jobs (sha256, job) VALUES (?, ?)", (sha256, job)
+        )
+
+    def names(self):
+        """Remote names of every file still tracked"""
+        return {row["name"] for row in self._connection().execute("SELECT name FROM remote_files")}
+
+    def release_jobs(self, jobs):
+        """Unlink deleted jobs, returns the remote names of the files no other job uses.
+
+        Those entries are removed, the caller deletes the remote files. Only
+        files that lost a job are candidates, an upload not linked yet is left
+        alone. Entries past their expiry are dropped too, the provider has
+        already deleted their files.
+        """
+        jobs = list(jobs)
+
+        def work(connection):
+            connection.execute("DELETE FROM remote_files WHERE expires < ?", (time.time(),))
+            unused = []
+            for job in jobs:
+                for row in connection.execute("SELECT sha256 FROM remote_file_jobs WHERE job = ?", (job,)).fetchall():
+                    connection.execute("DELETE FROM remote_file_jobs WHERE sha256 = ? AND job = ?", (row["sha256"], job))
+                    if connection.execute("SELECT 1 FROM remote_file_jobs WHERE sha256 = ?", (row["sha256"],)).fetchone():
+                        continue
+                    entry = connection.execute("SELECT name FROM remote_files WHERE sha256 = ?", (row["sha256"],)).fetchone()
+                    if entry:
+                        connection.execute("DELETE FROM remote_files WHERE sha256 = ?", (row["sha256"],))
+                        unused.append(entry["name"])
+            return unused
+
+        return self._transaction(work)
@@ -0,0 +1,47 @@
+import json
+
+_decoder = json.JSONDecoder()
+OPTION_LETTERS = "ABCDE"
+
+
+def salvage_json_array(text):
+    """Complete elements of a JSON array that may be cut off.
+
+    Decodes the array one element at a time and stops at the first element
+    that doesn't parse, which for a truncated response is the one it was cut
+    in. Returns the elements decoded so far.
+    """
+    start = text.find("[")
+    if start < 0:
+        return []
+    items = []
+    position = start + 1
+    length = len(text)
+    while position < length:
+        # Skip the separators between elements
+        while position < length and text[position] in " \t\r\n,":
+            position += 1
+        if position >= length or text[position] == "]":
+            break
+        try:
+            item, position = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+    return items
+
+
+def is_valid_question(item):
+    """Check an extracted object against the question schema the prompt asks for"""
+    if not isinstance(item, dict):
+        return False
+    question = item.get("question")
+    options = item.get("options")
+    answer = item.get("correct_answer")
+    if not isinstance(question, str) or not question.strip():
+        return False
+    if not isinstance(options, list) or len(options) < 2 or not all(isinstance(option, str) and option.strip() for option in options):
+        return False
+    if not isinstance(answer, str) or answer.strip().upper() not in OPTION_LETTERS[:len(options)]:
+        return False
+    return True
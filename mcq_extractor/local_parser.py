@@ -0,0 +1,152 @@
+import os
+import re
+import html
+
+_QUESTION_START_RE = re.compile(r'^[ \t]*(?:Q(?:uestion)?\.?[ \t]*)?(\d{1,4})[ \t]*[.)][ \t]+(?=\S)', re.MULTILINE | re.IGNORECASE)
+_INLINE_ANSWER_RE = re.compile(r'\b(?:correct\s+answer|answer|ans)\s*[.:\-]\s*\(?([A-Ea-e])\)?(?![\w])', re.IGNORECASE)
+# Layouts the model formats better (lists, tables, statements) are left to it
+_COMPLEX_LAYOUT_RE = re.compile(r'\b(list\s*[-–]?\s*(?:i|1)\b|column\s*[-–]?\s*(?:i|1|a)\b|match\s+the|statement\s*[-–]?\s*(?:i|1)\b|assertion|correct\s+order|sequence)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+OPTION_LETTERS = "ABCDE"
+
+
+# One style of option markers per question: (A), A., A) or a)
+_MARKER_STYLES = (
+    r'\(\s*[{upper}{lower}]\s*\)',
+    r'(?:(?<=\s)|^){upper}\.',
+    r'(?:(?<=\s)|^){upper}\)',
+    r'(?:(?<=\s)|^){lower}\)',
+)
+_OPTION_STYLES = [
+    [re.compile(style.format(upper=letter, lower=letter.lower()) + r'\s*', re.MULTILINE) for letter in OPTION_LETTERS]
+    for style in _MARKER_STYLES
+]
+# Any option marker of any style, which no option text of a clean parse contains
+_ANY_MARKER_RE = re.compile(r'\(\s*[A-Ea-e]\s*\)|(?:(?<=\s)|^)(?:[A-E][.)]|[a-e]\))', re.MULTILINE)
+
+
+def _option_positions(block, patterns):
+    """Start and end of consecutive option markers of one style, from A on"""
+    positions = []
+    search_from = 0
+    for pattern in patterns:
+        match = pattern.search(block, search_from)
+        if match is None:
+            break
+        positions.append((match.start(), match.end()))
+        search_from = match.end()
+    return positions
+
+
+def _clean(text):
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class LocalMCQParser:
+    """Rule-based extractor for clean text-layer exams.
+
+    Handles the regular "1. stem (A) .. (B) .. (C) .. (D) .." layout with
+    the answer taken from the document's answer key or an inline
+    "Answer: C". Produces the same schema as MCQExtractor, plus a confidence
+    score for the page range; ranges below min_confidence go to the model.
+    """
+
+    def __init__(self, min_confidence=None):
+        self.min_confidence = min_confidence if min_confidence is not None else float(os.getenv("LOCAL_PARSER_MIN_CONFIDENCE", "1.0"))
+
+    def _question_starts(self, text):
+        """Positions of question numbers, keeping only a consecutive numbering"""
+        starts = []
+        for match in _QUESTION_START_RE.finditer(text):
+            number = int(match.group(1))
+            # Numbered statements inside a question don't continue the sequence
+            if not starts or number == starts[-1][0] + 1:
+                starts.append((number, match.start(), match.end()))
+        return starts
+
+    def _parse_block(self, number, block, answer_key):
+        """Parse one question block, return the question dict or None"""
+        candidates = []
+        for patterns in _OPTION_STYLES:
+            positions = _option_positions(block, patterns)
+            if len(positions) >= 3:
+                candidates.append((positions, patterns))
+        # No options, or two marker styles that both read as options: the model sorts it out
+        if len(candidates) != 1:
+            return None
+        positions, patterns = candidates[0]
+
+        stem = _clean(block[:positions[0][0]])
+        if not stem or _COMPLEX_LAYOUT_RE.search(stem) or any(pattern.search(stem) for pattern in patterns):
+            return None
+
+        options = []
+        for index, (_, option_start) in enumerate(positions):
+            option_end = positions[index + 1][0] if index + 1 < len(positions) else len(block)
+            options.append(block[option_start:option_end])
+
+        # The last option runs until the block ends: keep its first line only, which drops
+        # page footers and headings, and look for an inline answer in what follows
+        last_option, _, trailing_text = options[-1].lstrip().partition("\n")
+        inline_answer = _INLINE_ANSWER_RE.search(last_option) or _INLINE_ANSWER_RE.search(trailing_text)
+        if inline_answer and inline_answer.string is last_option:
+            last_option = last_option[:inline_answer.start()]
+        options[-1] = last_option
+        options = [_clean(option) for option in options]
+        # An option running into another marker means the markers were misread
+        if not all(options) or any(_ANY_MARKER_RE.search(option) for option in options):
+            return None
+
+        answer = answer_key.get(number) if answer_key else None
+        if answer is None and inline_answer:
+            answer = inline_answer.group(1).upper()
+        if answer is None or OPTION_LETTERS.index(answer) >= len(options):
+            return None
+
+        return {
+            "SI.No": number,
+            "question": f"<p>{html.escape(stem, quote=False)}</p>",
+            "options": options,
+            "correct_answer": answer,
+            "type": "MCQ",
+        }
+
+    def parse_pages(self, pages, end_page, answer_key=None):
+        """Parse questions starting on pages up to end_page.
+
+        pages is a list of (page_number, text) and may include lookahead pages
+        after end_page, used only to finish questions broken across the page
+        boundary. Returns (questions, confidence between 0 and 1): the share
+        of question blocks that parse cleanly, with a single option marker
+        style, no option text holding another marker and a known answer.
+        """
+        text = ""
+        page_starts = []
+        for page_number, page_text in pages:
+            page_starts.append((len(text), page_number))
+            text += (page_text or "") + "\n"
+
+        def page_of(offset):
+            page_number = page_starts[0][1]
+            for start, number in page_starts:
+                if start > offset:
+                    break
+                page_number = number
+            return page_number
+
+        starts = self._question_starts(text)
+        questions = []
+        blocks = 0
+        for index, (number, block_start, body_start) in enumerate(starts):
+            if page_of(block_start) > end_page:
+                break
+            blocks += 1
+            block_end = starts[index + 1][1] if index + 1 < len(starts) else len(text)
+            question = self._parse_block(number, text[body_start:block_end], answer_key)
+            if question is not None:
+                questions.append(question)
+
+        if not blocks:
+            return [], 0.0
+        return questions, len(questions) / blocks
@@ -0,0 +1,302 @@
+import os
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from google.api_core import exceptions as google_exceptions
+from . import telemetry
+
+DEFAULT_RATE_LIMIT_STORE = "metadata/rate_limits.db"
+PDF_PAGE_TOKENS = 258  # Input tokens Gemini counts per PDF page
+CHARS_PER_TOKEN = 4
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+
+def backoff_delay(attempt, base_seconds=None, max_seconds=None):
+    """Exponential backoff with full jitter: uniform between 0 and base * 2^attempt"""
+    base_seconds = base_seconds if base_seconds is not None else float(os.getenv("BACKOFF_BASE_SECONDS", "1"))
+    max_seconds = max_seconds if max_seconds is not None else float(os.getenv("BACKOFF_MAX_SECONDS", "60"))
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+class SharedLimits:
+    """Token buckets, circuit breakers and in-flight slots shared by every process on the host.
+
+    The state lives in a small SQLite database, so the job subprocesses
+    running at the same time draw from one request and token quota, and
+    see the same breaker. Each operation is one short IMMEDIATE transaction.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("RATE_LIMIT_STORE", DEFAULT_RATE_LIMIT_STORE)
+        self._local = threading.local()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS breakers (
+                name TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                open_until REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS slots (
+                holder TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def take(self, name, amount, per_minute):
+        """Take amount from a bucket refilled at per_minute, holding at most one minute's worth.
+
+        Returns 0 when taken, otherwise the seconds until enough has refilled.
+        """
+        capacity = float(per_minute)
+        amount = min(amount, capacity)
+
+        def work(connection):
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+            wait = 0.0
+            if tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) * 60 / capacity
+            connection.execute(
+                "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (name, tokens, now),
+            )
+            return wait
+
+        return self._transaction(work)
+
+    def adjust(self, name, amount, per_minute):
+        """Give back (negative amount) or take more than estimated, without waiting"""
+        capacity = float(per_minute)
+
+        def work(connection):
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+            connection.execute(
+                "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (name, min(capacity, tokens - amount), now),
+            )
+
+        self._transaction(work)
+
+    def drain(self, name):
+        """Empty a bucket, after a 429 every process slows down, not just the one that got it"""
+        self._transaction(lambda connection: connection.execute(
+            "INSERT INTO buckets (name, tokens, updated) VALUES (?, 0, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = 0, updated = excluded.updated",
+            (name, time.time()),
+        ))
+
+    def acquire_slot(self, name, limit, ttl_seconds):
+        """Take one of limit concurrent slots, returns its holder id or None when all are taken.
+
+        Slots expire after ttl_seconds, so the ones held by a killed process
+        are freed without it.
+        """
+        def work(connection):
+            now = time.time()
+            connection.execute("DELETE FROM slots WHERE expires < ?", (now,))
+            taken = connection.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if taken >= limit:
+                return None
+            holder = uuid.uuid4().hex
+            connection.execute("INSERT INTO slots (holder, name, expires) VALUES (?, ?, ?)", (holder, name, now + ttl_seconds))
+            return holder
+
+        return self._transaction(work)
+
+    def release_slot(self, holder):
+        self._connection().execute("DELETE FROM slots WHERE holder = ?", (holder,))
+
+    def breaker_wait(self, name, threshold, reset_seconds):
+        """Seconds until the breaker lets a call through, 0 when it does.
+
+        Once the open period is over one caller gets a trial call, the
+        others keep waiting until it succeeds or the breaker opens again.
+        """
+        def work(connection):
+            now = time.time()
+            row = connection.execute("SELECT failures, open_until FROM breakers WHERE name = ?", (name,)).fetchone()
+            if row is None or row[0] < threshold:
+                return 0.0
+            if now < row[1]:
+                return row[1] - now
+            connection.execute("UPDATE breakers SET open_until = ? WHERE name = ?", (now + reset_seconds, name))
+            return 0.0
+
+        return self._transaction(work)
+
+    def breaker_result(self, name, success, threshold, reset_seconds):
+        """Record a call outcome, returns True when this failure opened the breaker"""
+        def work(connection):
+            if success:
+                connection.execute("DELETE FROM breakers WHERE name = ?", (name,))
+                return False
+            row = connection.execute("SELECT failures FROM breakers WHERE name = ?", (name,)).fetchone()
+            failures = (row[0] if row else 0) + 1
+            open_until = time.time() + reset_seconds if failures >= threshold else 0
+            connection.execute(
+                "INSERT INTO breakers (name, failures, open_until) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET failures = excluded.failures, open_until = excluded.open_until",
+                (name, failures, open_until),
+            )
+            return failures == threshold
+
+        return self._transaction(work)
+
+
+class ModelClient:
+    """Quota-aware wrapper around a model backend.
+
+    Every call first passes the circuit breaker, then takes one request from
+    the requests-per-minute bucket and its estimated input tokens from the
+    tokens-per-minute bucket. Errors are told apart:
+
+    - 429 quota errors empty the shared request bucket and retry after a backoff;
+    - 503 and other unavailability errors retry with backoff and count
+      against the breaker;
+    - 500 errors retry once, then go back to the caller, a batch that keeps
+      failing with 500 is split by MCQExtractor;
+    - timeouts count against the breaker and go back to the caller;
+    - anything else (bad requests) goes back straight away.
+
+    On top of the rates, at most max_in_flight calls run at the same time
+    across every process on the host, whatever the model.
+    """
+
+    def __init__(self, backend, limits=None, requests_per_minute=None, tokens_per_minute=None, max_retries=None,
+                 breaker_failures=None, breaker_reset_seconds=None, max_in_flight=None):
+        self.backend = backend
+        self.requests_per_minute = requests_per_minute if requests_per_minute is not None else int(os.getenv("GEMINI_RPM", "150"))
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else int(os.getenv("GEMINI_TPM", "2000000"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+        self.breaker_failures = breaker_failures or int(os.getenv("CIRCUIT_FAILURES", "5"))
+        self.breaker_reset_seconds = breaker_reset_seconds or float(os.getenv("CIRCUIT_RESET_SECONDS", "60"))
+        self.breaker_max_wait = float(os.getenv("CIRCUIT_MAX_WAIT_SECONDS", "300"))
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+        self.limits = limits or SharedLimits()
+
+    @staticmethod
+    def estimate_tokens(parts, pages):
+        """Input tokens of the text parts, plus the PDF's pages when a file is attached"""
+        text_tokens = sum(len(part) for part in parts if isinstance(part, str)) // CHARS_PER_TOKEN
+        has_file = any(not isinstance(part, str) for part in parts)
+        return text_tokens + (pages * PDF_PAGE_TOKENS if has_file else 0)
+
+    def _wait_for_breaker(self, model_name):
+        deadline = time.monotonic() + self.breaker_max_wait
+        while True:
+            wait = self.limits.breaker_wait(model_name, self.breaker_failures, self.breaker_reset_seconds)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise CircuitOpenError(f"{model_name} circuit breaker open for another {wait:.0f}s")
+            print(f"Circuit breaker open for {model_name}, waiting {wait:.0f}s")
+            time.sleep(wait)
+
+    def _take(self, bucket, amount, per_minute):
+        if per_minute <= 0:
+            return
+        while True:
+            wait = self.limits.take(bucket, amount, per_minute)
+            if not wait:
+                return
+            time.sleep(wait + random.uniform(0, 0.25))  # Jitter so waiting processes don't wake together
+
+    def _acquire_slot(self, timeout):
+        """Wait for a free in-flight slot, held at most for the call's deadline"""
+        if self.max_in_flight <= 0:
+            return None
+        while True:
+            slot = self.limits.acquire_slot("in_flight", self.max_in_flight, timeout + 30)
+            if slot is not None:
+                return slot
+            time.sleep(random.uniform(0.05, 0.25))
+
+    def _record(self, model_name, success):
+        if self.limits.breaker_result(model_name, success, self.breaker_failures, self.breaker_reset_seconds):
+            print(f"❌ Circuit breaker opened for {model_name} after {self.breaker_failures} failures in a row")
+            telemetry.inc("mcq_circuit_breaker_opened_total", model=model_name)
+
+    def generate_content(self, model_name, parts, timeout, pages=1):
+        """Call the backend within quota, retrying what is worth retrying"""
+        estimate = self.estimate_tokens(parts, pages)
+        server_errors = 0
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_breaker(model_name)
+            self._take(f"{model_name}:requests", 1, self.requests_per_minute)
+            self._take(f"{model_name}:tokens", estimate, self.tokens_per_minute)
+            slot = self._acquire_slot(timeout)
+            try:
+                response = self.backend.generate_content(model_name, parts, timeout)
+            except google_exceptions.ResourceExhausted:
+                # Quota, not an outage: every process backs off, the breaker is left alone
+                self.limits.drain(f"{model_name}:requests")
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt + 2)
+                print(f"Quota exceeded for {model_name}, retrying in {delay:.1f}s")
+                telemetry.inc("mcq_retries_total", reason="quota")
+            except google_exceptions.InternalServerError:
+                self._record(model_name, False)
+                server_errors += 1
+                if server_errors > 1 or attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Server error from {model_name}, retrying in {delay:.1f}s")
+                telemetry.inc("mcq_retries_total", reason="server_error")
+            except (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded) as e:
+                self._record(model_name, False)
+                if isinstance(e, google_exceptions.DeadlineExceeded) or attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"{model_name} unavailable, retrying in {delay:.1f}s")
+                telemetry.inc("mcq_retries_total", reason="unavailable")
+            else:
+                self._record(model_name, True)
+                usage = getattr(response, "usage_metadata", None)
+                actual = getattr(usage, "prompt_token_count", 0) or 0
+                if actual and self.tokens_per_minute > 0:
+                    self.limits.adjust(f"{model_name}:tokens", actual - estimate, self.tokens_per_minute)
+                return response
+            finally:
+                if slot is not None:
+                    self.limits.release_slot(slot)
+            time.sleep(delay)
@@ -0,0 +1,71 @@
+import time
+from .json_salvage import is_valid_question
+from . import telemetry
+
+MAX_OPTIONS = 4  # The prompt asks for at most four options, A to D
+
+
+def batch_problems(questions, expect_questions=False):
+    """Reasons a batch's results can't be trusted, an empty list when they look right.
+
+    Every question is checked against the schema, its option count and its
+    answer letter, which has to name one of its options. Finding nothing is
+    only a problem when the pre-scan saw questions on the batch's pages,
+    a passage or a cover page rightly has none.
+    """
+    if not questions:
+        return ["no questions"] if expect_questions else []
+    problems = []
+    invalid = sum(1 for question in questions if not is_valid_question(question))
+    if invalid:
+        problems.append(f"{invalid} of {len(questions)} questions fail the schema or answer letter check")
+    too_many = sum(1 for question in questions if isinstance(question, dict) and len(question.get("options") or []) > MAX_OPTIONS)
+    if too_many:
+        problems.append(f"{too_many} questions with more than {MAX_OPTIONS} options")
+    return problems
+
+
+class ModelRouter:
+    """Send each batch up the extractor's model ladder until its results pass validation.
+
+    The first, fast model handles every batch. A batch whose results fail
+    batch_problems goes to the next model, and the last model's results are
+    kept whatever they look like, unless it finds nothing at all and a
+    model before it did. Each batch's route
+    (models tried, outcome, time and problems found) is logged and counted.
+    """
+
+    def __init__(self, extractor, ladder=None):
+        self.extractor = extractor
+        self.ladder = ladder or extractor.model_ladder
+
+    def extract(self, pdf_part, start_page, end_page, custom_prompt, questions_to_ignore, answer_key=None, pages=None, expect_questions=False):
+        """Extract one batch, escalating as needed, returns the questions of the model that was kept"""
+        pages = pages or f"{start_page}-{end_page}"
+        route = []
+        results = []
+        fallback = []  # Last non-empty results, kept if the top model returns nothing
+        for level, model_name in enumerate(self.ladder):
+            started = time.perf_counter()
+            results = self.extractor.extract_mcqs_from_pages(
+                pdf_part, start_page, end_page, custom_prompt, questions_to_ignore,
+                answer_key=answer_key, model_name=model_name
+            )
+            results = results if isinstance(results, list) else []
+            problems = batch_problems(results, expect_questions)
+            accepted = not problems or level == len(self.ladder) - 1
+            route.append({
+                "model": model_name,
+                "outcome": "accepted" if accepted else "escalated",
+                "questions": len(results),
+                "seconds": round(time.perf_counter() - started, 3),
+                "problems": problems,
+            })
+            telemetry.inc("mcq_model_routes_total", model=model_name, outcome=route[-1]["outcome"])
+            if accepted:
+                break
+            fallback = results or fallback
+            print(f"Escalating pages {pages} from {model_name}: {'; '.join(problems)}")
+
+        telemetry.log(event="route", pages=pages, route=route)
+        return results or fallback
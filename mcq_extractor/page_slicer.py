@@ -0,0 +1,46 @@
+import os
+import hashlib
+import threading
+import time
+from pypdf import PdfReader, PdfWriter
+
+
+class PageSlicer:
+    """Cut page ranges of a PDF into small sub-PDFs, cached on disk.
+
+    Each batch is sent to Gemini as its own sub-PDF, so the payload grows with
+    the batch size instead of the document size. Slices are named after the
+    fingerprints of the pages they contain and are reused across jobs.
+    """
+
+    def __init__(self, pdf_path, page_hashes, cache_dir, lookahead_pages=1):
+        self.pdf_path = pdf_path
+        self.page_hashes = page_hashes
+        self.cache_dir = cache_dir
+        self.lookahead_pages = lookahead_pages  # The prompt allows finishing a broken question on the next page
+        self._reader = None
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def slice(self, start_page, end_page):
+        """Return (slice_path, relative_start, relative_end) for a 1-based page range"""
+        last_page = min(end_page + self.lookahead_pages, len(self.page_hashes))
+        digest = hashlib.sha256("".join(self.page_hashes[start_page - 1:last_page]).encode("ascii"))
+        slice_path = os.path.join(self.cache_dir, digest.hexdigest() + ".pdf")
+
+        if os.path.exists(slice_path):
+            os.utime(slice_path, (time.time(), os.stat(slice_path).st_mtime))
+        else:
+            # pypdf readers are not thread-safe, batches are sliced one at a time
+            with self._lock:
+                if self._reader is None:
+                    self._reader = PdfReader(self.pdf_path)
+                writer = PdfWriter()
+                for page_index in range(start_page - 1, last_page):
+                    writer.add_page(self._reader.pages[page_index])
+                tmp_path = f"{slice_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    writer.write(f)
+                os.replace(tmp_path, slice_path)
+
+        return slice_path, 1, end_page - start_page + 1
@@ -0,0 +1,151 @@
+import re
+import pdfplumber
+
+PAGE_MCQ = "mcq"
+PAGE_ANSWER_KEY = "answer_key"
+PAGE_PROSE = "prose"
+PAGE_EMPTY = "empty"
+PAGE_SCANNED = "scanned"
+
+# Kinds of pages that are sent to the model
+QUESTION_PAGE_KINDS = (PAGE_MCQ, PAGE_SCANNED)
+
+_QUESTION_MARKER_RE = re.compile(r'^\s*(?:Q(?:uestion)?\.?\s*)?(\d{1,4})\s*[.)]\s*\S', re.MULTILINE | re.IGNORECASE)
+_OPTION_MARKER_RE = re.compile(r'(?:^|\s)(?:\(\s*[A-Da-d]\s*\)|[A-Da-d]\)|[A-D]\.)\s*[^\s\d]')
+_ANSWER_PAIR_RE = re.compile(r'(?<![\w.])(\d{1,4})\s*(?:[.):-]|=>?)?\s*\(?([A-Da-d])\)?(?![\w(])')
+_ANSWER_HEADING_RE = re.compile(r'\b(answer\s*key|answers|key\s*to\s*questions)\b', re.IGNORECASE)
+
+
+def classify_page_text(text, has_images):
+    """Classify one page from its text layer with cheap pattern counts.
+
+    Returns a scan dict: kind, question numbers found and marker counts.
+    Anything ambiguous is classified as MCQ content so it still reaches the
+    model, only clearly empty, prose-only or answer-key pages are skipped.
+    """
+    text = text or ""
+    stripped = text.strip()
+    question_numbers = [int(number) for number in _QUESTION_MARKER_RE.findall(text)]
+    option_markers = len(_OPTION_MARKER_RE.findall(text))
+    answer_pairs = _ANSWER_PAIR_RE.findall(text)
+
+    if len(stripped) < 20:
+        kind = PAGE_SCANNED if has_images else PAGE_EMPTY
+    elif option_markers >= 2:
+        kind = PAGE_MCQ
+    elif len(answer_pairs) >= 5 and (_ANSWER_HEADING_RE.search(text) or len(answer_pairs) * 8 >= len(stripped.split())):
+        kind = PAGE_ANSWER_KEY
+    elif len(question_numbers) >= 2:
+        kind = PAGE_MCQ  # Numbered items, their options may sit on the next page
+    else:
+        kind = PAGE_PROSE
+
+    return {
+        "kind": kind,
+        "text": text,
+        "text_length": len(stripped),
+        "question_numbers": question_numbers,
+        "option_markers": option_markers,
+        "answer_pairs": answer_pairs if kind == PAGE_ANSWER_KEY else [],
+        "has_images": has_images,
+    }
+
+
+def scan_pdf(pdf_path):
+    """Classify every page of a PDF, returns one scan dict per page in order"""
+    page_scans = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            scan = classify_page_text(page.extract_text(), bool(page.images))
+            scan["page"] = page_number
+            page_scans.append(scan)
+            # Parsed layout objects are cached per page, drop them as we go
+            page.flush_cache()
+    return page_scans
+
+
+def extract_answer_keys(page_scans):
+    """Read the answer-key pages, returns (first_page, last_page, {number: letter}) per key.
+
+    A key covers the pages since the previous key up to its own last page,
+    so sections that restart their numbering each keep their own answers.
+    A number read with two different letters in one key is dropped.
+    """
+    answer_keys = []
+    first_page = 1
+    answers = None
+    for scan in page_scans:
+        if scan["answer_pairs"]:
+            if answers is None:
+                answers, conflicts = {}, set()
+            for number, letter in scan["answer_pairs"]:
+                number, letter = int(number), letter.upper()
+                if answers.setdefault(number, letter) != letter:
+                    conflicts.add(number)
+            last_page = scan["page"]
+        elif answers is not None:
+            answer_keys.append((first_page, last_page, {n: l for n, l in answers.items() if n not in conflicts}))
+            first_page, answers = scan["page"], None
+    if answers is not None:
+        answer_keys.append((first_page, last_page, {n: l for n, l in answers.items() if n not in conflicts}))
+    return answer_keys
+
+
+def page_answers(answer_keys, page):
+    """The answers of the key covering this page, empty when no key follows it"""
+    for first_page, last_page, answers in answer_keys:
+        if first_page <= page <= last_page:
+            return answers
+    return {}
+
+
+def question_pages(page_scans):
+    """Pages to send to the model: question pages and the prose pages right next to them.
+
+    A prose page before or after questions is often the passage they ask
+    about (reading comprehension, data interpretation), so it is kept.
+    Falls back to every page when no page looks like it holds questions,
+    the heuristics don't know every layout.
+    """
+    kinds = {scan["page"]: scan["kind"] for scan in page_scans}
+    pages = {page for page, kind in kinds.items() if kind in QUESTION_PAGE_KINDS}
+    if not pages:
+        return sorted(kinds)
+    for page in list(pages):
+        for neighbour in (page - 1, page + 1):
+            if kinds.get(neighbour) == PAGE_PROSE:
+                pages.add(neighbour)
+    return sorted(pages)
+
+
+def has_question_pages(page_scans, start_page, end_page):
+    """Whether the pre-scan saw questions on any page of the range"""
+    return any(scan["kind"] in QUESTION_PAGE_KINDS for scan in page_scans[start_page - 1:end_page])
+
+
+def is_prose(page_scans, page):
+    return page_scans[page - 1]["kind"] == PAGE_PROSE
+
+
+def plan_question_batches(page_scans, pages_per_batch):
+    """Build (start_page, end_page) batches from runs of question_pages().
+
+    A skipped page ends the current batch, and runs longer than
+    pages_per_batch are cut. A cut never leaves a prose page at the end of
+    a batch, away from the questions that follow it.
+    """
+    batches = []
+    for page in question_pages(page_scans):
+        if not batches or page != batches[-1][1] + 1:
+            batches.append((page, page))
+            continue
+        start, end = batches[-1]
+        # A passage alone is never a batch, it stays with the page after it
+        if page - start < pages_per_batch or (start == end and is_prose(page_scans, end)):
+            batches[-1] = (start, page)
+        elif is_prose(page_scans, end):
+            batches[-1] = (start, end - 1)
+            batches.append((end, page))
+        else:
+            batches.append((page, page))
+    return batches
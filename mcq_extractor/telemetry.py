@@ -0,0 +1,150 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Seconds, from a JSON parse to a whole job
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_logger = logging.getLogger("mcq_extractor.telemetry")
+if not _logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Samples recorded in a job subprocess are forwarded to the server process
+    and applied here, so /metrics covers every job.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def apply(self, sample):
+        """Record one sample dict: kind, name, value and labels"""
+        key = (sample["name"], tuple(sorted(sample["labels"].items())))
+        value = sample["value"]
+        with self._lock:
+            if sample["kind"] == "counter":
+                self._counters[key] = self._counters.get(key, 0) + value
+            elif sample["kind"] == "gauge":
+                self._gauges[key] = value
+            else:
+                histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                for index, bound in enumerate(self.buckets):
+                    if value <= bound:
+                        histogram[0][index] += 1
+                histogram[1] += value
+                histogram[2] += 1
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(buckets), total, count)) for key, (buckets, total, count) in self._histograms.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            declare(name, "histogram")
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+registry = MetricsRegistry()
+_forward = None  # Set in job subprocesses, sends samples to the server process
+_context = {}  # Added to every structured log line, e.g. the job uuid
+
+
+def forward_to(send):
+    """Send samples to another process (through send) instead of the local registry"""
+    global _forward
+    _forward = send
+
+
+def set_context(**fields):
+    _context.clear()
+    _context.update(fields)
+
+
+def _record(kind, name, value, labels):
+    sample = {"kind": kind, "name": name, "value": value, "labels": {key: str(label) for key, label in labels.items()}}
+    if _forward is not None:
+        _forward(sample)
+    else:
+        registry.apply(sample)
+
+
+def inc(name, value=1, **labels):
+    _record("counter", name, value, labels)
+
+
+def set_gauge(name, value, **labels):
+    _record("gauge", name, value, labels)
+
+
+def observe(name, value, **labels):
+    _record("histogram", name, value, labels)
+
+
+def log(event, **fields):
+    """One structured (JSON) log line"""
+    _logger.info(json.dumps(dict(_context, event=event, **fields), ensure_ascii=False, default=str))
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time a stage into mcq_stage_duration_seconds and log it.
+
+    Yields a dict, keys added to it while the stage runs end up in the log
+    line. Setting its "outcome" key overrides the ok/error outcome.
+    """
+    details = dict(fields)
+    outcome = "ok"
+    started = time.perf_counter()
+    try:
+        yield details
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        outcome = details.pop("outcome", outcome)
+        observe("mcq_stage_duration_seconds", elapsed, stage=stage, outcome=outcome)
+        log("span", stage=stage, outcome=outcome, seconds=round(elapsed, 4), **details)
@@ -0,0 +1,315 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from docx import Document
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from mcq_extractor.batch_processor import MCQBatchProcessor
+from mcq_extractor.cache import file_sha256
+from mcq_extractor.checkpoint import checkpoint_path
+from mcq_extractor import telemetry
+from job_store import create_job_store
+from results import write_result
+from storage import storage_path
+
+
+########################################## CALLING CONVERSION FUNCTION ##########################################
+def convert_docx_to_pdf_custom(docx_path, pdf_path):
+    """Convert DOCX to PDF using python-docx and reportlab"""
+    try:
+        # Read the DOCX file
+        doc = Document(docx_path)
+
+        # Create PDF document
+        pdf_doc = SimpleDocTemplate(pdf_path, pagesize=letter)
+        styles = getSampleStyleSheet()
+        story = []
+
+        # Extract text from DOCX and add to PDF
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():  # Only add non-empty paragraphs
+                p = Paragraph(paragraph.text, styles['Normal'])
+                story.append(p)
+                story.append(Spacer(1, 12))  # Add space between paragraphs
+
+        # Build the PDF
+        pdf_doc.build(story)
+        return True
+
+    except Exception as e:
+        print(f"Error in custom DOCX to PDF conversion: {e}")
+        return False
+
+def remove_job_files(file_path: str):
+    """Delete an upload and the PDF converted from it, if any"""
+    pdf_path = file_path.replace('.docx', '.pdf') if file_path.endswith('.docx') else file_path
+    for path in {file_path, pdf_path}:
+        if os.path.exists(path):
+            os.remove(path)
+
+def process_file_core(job_store, file_path: str, result_file_name: str, uuid: str, customInput: str, file_hash: str = None, progress=None):
+    """Core processing logic without timeout wrapper.
+
+    progress, when given, is called with a dict each time the job moves on
+    (phase, batch i of n, questions found so far).
+    """
+    if not os.path.isfile(file_path):
+        print(f"❌ File not found: {file_path}")
+        job_store.transition(uuid, "Processing", "Error: File not found")
+        return
+
+    # The result cache is keyed on the uploaded bytes, not on the converted PDF
+    file_hash = file_hash or file_sha256(file_path)
+
+    # A DOCX is read natively, its text goes to the model without a PDF; DOCX_NATIVE=0 converts it first
+    native_docx = file_path.endswith('.docx') and os.getenv("DOCX_NATIVE", "1") != "0"
+
+    # Check if the file is a DOCX and needs conversion
+    pdf_path = file_path
+    if file_path.endswith('.docx') and not native_docx:
+        # Convert DOCX to PDF
+        pdf_path = file_path.replace('.docx', '.pdf')
+        if progress:
+            progress({"phase": "converting"})
+        try:
+            with telemetry.span("docx_conversion") as stage:
+                success = convert_docx_to_pdf_custom(file_path, pdf_path)
+                stage["outcome"] = "ok" if success else "error"
+            if success:
+                # The DOCX is kept until the job ends, a job resumed after a restart starts from it
+                print(f"✅ Converted DOCX to PDF: {pdf_path}")
+            else:
+                print(f"❌ Error converting DOCX to PDF")
+                job_store.transition(uuid, "Processing", "Error: Failed to convert DOCX to PDF")
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                return
+        except Exception as e:
+            print(f"❌ Exception during DOCX conversion: {e}")
+            job_store.transition(uuid, "Processing", f"Error: DOCX conversion failed - {str(e)}")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return
+
+    try:
+        # Extract the MCQs from the PDF, or the DOCX's text
+        processor = MCQBatchProcessor(os.getenv("API_KEY"), progress=progress, job_id=uuid)
+        if native_docx:
+            questions = processor.process_docx(
+                file_path, customInput, file_hash=file_hash, checkpoint_path=checkpoint_path(result_file_name)
+            )
+        else:
+            questions = processor.process_pdf_in_batches(
+                pdf_path, customInput, file_hash=file_hash, checkpoint_path=checkpoint_path(result_file_name)
+            )
+
+        if questions == []:
+            print("No questions found ")
+            status = "Processed, No questions found"
+        else:
+            print(f"Successfully extracted {len(questions)} questions")
+            status = "Processed"
+
+        # Write result file
+        with telemetry.span("result_write", questions=len(questions)):
+            # With its byte-offset index and compressed copies, /json/{uuid} serves it as is
+            write_result(result_file_name, questions)
+
+        print(f"Processing done, result saved as {result_file_name}")
+        # Final statuses only replace "Processing": a job cancelled meanwhile stays cancelled
+        if not job_store.transition(uuid, "Processing", status):
+            print(f"Job {uuid} was cancelled before it finished")
+        # The result file supersedes the checkpoint
+        if os.path.exists(checkpoint_path(result_file_name)):
+            os.remove(checkpoint_path(result_file_name))
+
+    except Exception as e:
+        print(f"❌ Error during MCQ processing: {e}")
+        job_store.transition(uuid, "Processing", f"Error: MCQ processing failed - {str(e)}")
+    finally:
+        # Clean up the upload and the PDF converted from it
+        remove_job_files(file_path)
+
+def _job_process_main(file_path: str, result_file_name: str, uuid: str, customInput: str, file_hash: str = None, events=None):
+    """Entry point of the per-job subprocess, progress and metrics go back through the events queue"""
+    load_dotenv()
+    telemetry.set_context(job=uuid)
+    progress = None
+    if events is not None:
+        progress = lambda event: events.put(("progress", event))
+        telemetry.forward_to(lambda sample: events.put(("metric", sample)))
+    process_file_core(create_job_store(), file_path, result_file_name, uuid, customInput, file_hash, progress)
+
+########################################## JOB RUNNER ##########################################
+def _status_outcome(status):
+    """Low-cardinality outcome of a final job status, for metrics"""
+    if status.startswith("Processed"):
+        return "processed"
+    if status == "Cancelled":
+        return "cancelled"
+    if status == "Error: Processing timeout":
+        return "timeout"
+    return "error"
+
+class JobRunner:
+    """Run each job in its own subprocess so it can be stopped for real.
+
+    A thread blocked on a hung Gemini call can't be interrupted, a process
+    can. On timeout or cancellation the job's process is terminated, its
+    files removed and the calling worker is free again straight away.
+
+    With an event bus, the job's progress is relayed from the subprocess
+    and its final status published when it ends.
+    """
+
+    def __init__(self, job_store, timeout_seconds=None, events=None):
+        self.job_store = job_store
+        self.events = events
+        self.timeout_seconds = timeout_seconds or int(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+        # spawn, not fork: the gRPC client used by google-generativeai is not fork-safe
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = {}
+        self._cancelled = set()
+        self._abandoned = set()  # Jobs whose lease was lost, another worker owns them now
+        self._lock = threading.Lock()
+
+    def run(self, metadata, claim=None):
+        """Process one job and block until it finishes, times out or is cancelled.
+
+        claim, when given, marks the job as processing and returns False if
+        it was taken or cancelled first. It is called once the job is
+        registered here, so a cancel right after it is not lost.
+        """
+        uuid = metadata["uuid"]
+        with self._lock:
+            self._processes[uuid] = None  # Not started yet, cancel() only flags it
+        if claim is not None and not claim():
+            with self._lock:
+                self._processes.pop(uuid, None)
+                self._cancelled.discard(uuid)
+            return
+        file_path = storage_path(metadata["file_location"])
+        events = self._context.Queue() if self.events is not None else None
+        process = self._context.Process(
+            target=_job_process_main,
+            args=(file_path, storage_path(metadata["json_filename"]), uuid, metadata.get("custom_input", ""), metadata.get("sha256"), events),
+            name=f"job-{uuid}",
+            daemon=True,
+        )
+        started = time.monotonic()
+        try:
+            with self._lock:
+                # Cancelled or abandoned before its process started, it never starts
+                started = uuid not in self._cancelled and uuid not in self._abandoned
+                if started:
+                    process.start()
+                    self._processes[uuid] = process
+            if not started:
+                pass
+            elif events is not None:
+                self._relay_progress(uuid, process, events)
+            else:
+                process.join(self.timeout_seconds)
+
+            if uuid in self._abandoned:
+                if started:
+                    self._stop(process)
+                print(f"Job {uuid} stopped, it is left to another worker")
+            elif process.is_alive():
+                self._stop(process)
+                print(f"❌ Processing timeout after {self.timeout_seconds} seconds")
+                self.job_store.transition(uuid, "Processing", "Error: Processing timeout")
+                remove_job_files(file_path)
+            elif uuid in self._cancelled:
+                print(f"Job {uuid} cancelled")
+                self.job_store.update_status(uuid, "Cancelled")
+                remove_job_files(file_path)
+            elif process.exitcode != 0:
+                print(f"❌ Job process exited with code {process.exitcode}")
+                self.job_store.transition(uuid, "Processing", f"Error: Job process exited with code {process.exitcode}")
+                remove_job_files(file_path)
+        except Exception as e:
+            # e.g. the process couldn't start, the status published below must not stay "Processing"
+            print(f"❌ Job {uuid} failed: {e}")
+            if process.is_alive():
+                self._stop(process)
+            self.job_store.transition(uuid, "Processing", f"Error: {str(e)}")
+        finally:
+            with self._lock:
+                self._processes.pop(uuid, None)
+                self._cancelled.discard(uuid)
+                abandoned = uuid in self._abandoned
+                self._abandoned.discard(uuid)
+            # An abandoned job's status belongs to the worker that took it over
+            final = self.job_store.get(uuid) if not abandoned else None
+            outcome = _status_outcome(final["status"]) if final else "abandoned" if abandoned else "unknown"
+            telemetry.observe("mcq_job_duration_seconds", time.monotonic() - started, outcome=outcome)
+            telemetry.inc("mcq_jobs_total", outcome=outcome)
+            if events is not None:
+                events.close()
+                if final:
+                    self.events.publish(uuid, status=final["status"])
+
+    def _relay_progress(self, uuid, process, events):
+        """Publish the job's progress events until it exits or runs out of time"""
+        deadline = time.monotonic() + self.timeout_seconds
+        while process.is_alive():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                self._relay(uuid, events.get(timeout=min(remaining, 1.0)))
+            except queue.Empty:
+                continue
+        process.join()
+        # Events the process sent right before exiting
+        while True:
+            try:
+                self._relay(uuid, events.get_nowait())
+            except queue.Empty:
+                return
+
+    def _relay(self, uuid, event):
+        kind, payload = event
+        if kind == "metric":
+            telemetry.registry.apply(payload)
+        else:
+            self.events.publish(uuid, progress=payload)
+
+    def cancel(self, uuid):
+        """Stop a running job, return False when it isn't running here"""
+        with self._lock:
+            if uuid not in self._processes:
+                return False
+            self._cancelled.add(uuid)
+            process = self._processes[uuid]
+        if process is not None:
+            self._stop(process)
+        return True
+
+    def abandon(self, uuid):
+        """Stop a running job without touching its status or files, another worker has taken it over"""
+        with self._lock:
+            if uuid not in self._processes:
+                return False
+            self._abandoned.add(uuid)
+            process = self._processes[uuid]
+        if process is not None:
+            self._stop(process)
+        return True
+
+    def is_running(self, uuid):
+        with self._lock:
+            return uuid in self._processes
+
+    @staticmethod
+    def _stop(process):
+        process.terminate()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
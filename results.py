@@ -0,0 +1,174 @@
+"""Result files of finished jobs, stored so that serving them costs next to nothing.
+
+Next to Outputs/<uuid>.json, write_result() keeps:
+- <uuid>.json.idx: the byte range of every question in the file, its size
+  and a strong ETag (SHA-256 of the bytes), so pages of questions are read
+  straight from the file without parsing it;
+- <uuid>.json.gz (and <uuid>.json.br when brotli is installed): the full
+  /json/{uuid} response body, compressed once instead of on every fetch.
+
+Results written before the index existed get one the first time they are served.
+"""
+import os
+import gzip
+import json
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always available
+    brotli = None
+
+INDEX_SUFFIX = ".idx"
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# /json/{uuid} keeps the response envelope it always had, the stored array goes into "data"
+FULL_PREFIX = b'{"status":1,"message":"File Processed Succesfully","data":'
+FULL_SUFFIX = b'}'
+FULL_CHUNK_BYTES = 256 * 1024
+
+
+def result_files(json_path):
+    """The result file and every file derived from it"""
+    return [json_path, json_path + INDEX_SUFFIX] + [json_path + suffix for suffix in ENCODING_SUFFIXES.values()]
+
+
+def available_encodings():
+    return [name for name in ENCODING_SUFFIXES if name != "br" or brotli is not None]
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _serialize(questions):
+    """JSON array bytes in the json.dumps(indent=2) layout, and the byte range of each element"""
+    parts = [b"[\n"]
+    offsets = []
+    position = 2
+    for number, question in enumerate(questions):
+        if number:
+            parts.append(b",\n")
+            position += 2
+        element = "\n".join("  " + line for line in json.dumps(question, indent=2, ensure_ascii=False).split("\n")).encode("utf-8")
+        offsets.append((position, position + len(element)))
+        parts.append(element)
+        position += len(element)
+    parts.append(b"\n]" if questions else b"]")
+    return b"".join(parts), offsets
+
+
+def _write_atomic(path, data):
+    # One temporary file per writer, requests rebuilding the same legacy index may race
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _write_derived(json_path, data, offsets):
+    index = {
+        "etag": hashlib.sha256(data).hexdigest(),
+        "size": len(data),
+        "mtime_ns": os.stat(json_path).st_mtime_ns,
+        "offsets": offsets,
+    }
+    full_body = FULL_PREFIX + data + FULL_SUFFIX
+    for encoding in available_encodings():
+        _write_atomic(json_path + ENCODING_SUFFIXES[encoding], compress(full_body, encoding))
+    # Written last: an index only exists once everything it describes does
+    _write_atomic(json_path + INDEX_SUFFIX, json.dumps(index).encode("utf-8"))
+    return index
+
+
+def write_result(json_path, questions):
+    """Write a job's questions with their index and compressed copies"""
+    data, offsets = _serialize(questions)
+    _write_atomic(json_path, data)
+    return _write_derived(json_path, data, offsets)
+
+
+def load_index(json_path):
+    """Index of a result file, built (once) for results that don't have a current one"""
+    try:
+        with open(json_path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        stat = os.stat(json_path)
+        if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    with open(json_path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    return write_result(json_path, questions if isinstance(questions, list) else [])
+
+
+def read_questions_bytes(json_path, index, offset, limit):
+    """Bytes of the JSON array holding questions offset..offset+limit, read from the file by range"""
+    selected = index["offsets"][offset:offset + limit]
+    if not selected:
+        return b"[]"
+    start, end = selected[0][0], selected[-1][1]
+    with open(json_path, "rb") as f:
+        f.seek(start)
+        return b"[\n" + f.read(end - start) + b"\n]"
+
+
+def full_body_chunks(f):
+    """The full /json/{uuid} response body of an open result file, a chunk at a time.
+
+    The file is opened by the caller, a result replaced meanwhile is still
+    read from the version whose size was announced. Closed once read.
+    """
+    try:
+        yield FULL_PREFIX
+        while True:
+            chunk = f.read(FULL_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+        yield FULL_SUFFIX
+    finally:
+        f.close()
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header names this ETag (weak or strong) or is *"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any((candidate[2:] if candidate.startswith("W/") else candidate) == etag for candidate in candidates)
+
+
+def accepted_encodings(accept_encoding):
+    """The encodings we can produce that the client accepts, best first"""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return [encoding for encoding in available_encodings() if accepted.get(encoding, accepted.get("*", 0)) > 0]
+
+
+def preferred_encoding(accept_encoding):
+    """The best encoding we can produce that the client accepts, None for identity"""
+    encodings = accepted_encodings(accept_encoding)
+    return encodings[0] if encodings else None
+
+
+def stored_encoding(json_path, accept_encoding):
+    """The best compressed copy of the full result on disk that the client accepts, None for identity.
+
+    A copy can be missing, e.g. .br for results written before brotli was installed.
+    """
+    for encoding in accepted_encodings(accept_encoding):
+        if os.path.isfile(json_path + ENCODING_SUFFIXES[encoding]):
+            return encoding
+    return None
@@ -0,0 +1,46 @@
+"""Where uploads and results live.
+
+Job metadata stores locations relative to STORAGE_DIR (tempUploads/<uuid>.pdf,
+Outputs/<uuid>.json), never an absolute path, so the files are still found
+after the storage moves or is mounted elsewhere (e.g. in a container). Absolute
+paths of older metadata are mapped onto the storage by their last two
+components when they don't exist here (e.g. /Users/.../Outputs/<uuid>.json).
+"""
+import os
+
+UPLOAD_DIRECTORY = "tempUploads"
+OUTPUT_DIRECTORY = "Outputs"
+
+
+def storage_root():
+    return os.path.abspath(os.getenv("STORAGE_DIR") or os.path.dirname(os.path.abspath(__file__)))
+
+
+def storage_path(location):
+    """Local path of a location stored in job metadata"""
+    if not location:
+        return location
+    if not os.path.isabs(location):
+        return os.path.join(storage_root(), location)
+    if os.path.exists(location):
+        return location
+    return os.path.join(storage_root(), os.path.basename(os.path.dirname(location)), os.path.basename(location))
+
+
+def storage_location(path):
+    """Location of a local path for job metadata, relative when it is inside the storage"""
+    relative = os.path.relpath(os.path.abspath(path), storage_root())
+    return path if relative == os.pardir or relative.startswith(os.pardir + os.sep) else relative
+
+
+def upload_directory():
+    return os.path.join(storage_root(), UPLOAD_DIRECTORY)
+
+
+def output_directory():
+    return os.path.join(storage_root(), OUTPUT_DIRECTORY)
+
+
+def ensure_directories():
+    os.makedirs(upload_directory(), exist_ok=True)
+    os.makedirs(output_directory(), exist_ok=True)
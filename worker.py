@@ -0,0 +1,184 @@
+"""Worker process of a scaled-out deployment.
+
+API nodes started with JOB_EXECUTION=workers only store uploads as queued
+jobs. Any number of these workers, on the same host and sharing the job
+store and the storage (STORAGE_DIR), claim queued jobs and run each one in
+its own subprocess through JobRunner, exactly as the API's in-process queue
+does.
+
+A claimed job is leased to its worker. The worker's heartbeat extends the
+leases of its running jobs every third of JOB_LEASE_SECONDS. When a worker
+dies, its leases run out and the next worker to look reclaims the jobs:
+they are queued again, or fail after JOB_MAX_ATTEMPTS. A job cancelled
+through the API loses its lease, and its worker stops it on the next heartbeat.
+
+The metrics of the jobs a worker runs (model calls, stages, cache, job
+outcomes) stay in the worker process. Each worker serves them for
+Prometheus at :WORKER_METRICS_PORT/metrics, next to the API's /metrics.
+
+    python worker.py [--slots 2] [--metrics-port 9101]
+"""
+import os
+import socket
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mcq_extractor import telemetry
+from processing import JobRunner
+
+
+class StoreProgress:
+    """Event bus stand-in for JobRunner: progress goes to the job store, where API nodes read it"""
+
+    def __init__(self, job_store):
+        self.job_store = job_store
+
+    def publish(self, uuid, status=None, progress=None):
+        # The job subprocess writes statuses itself
+        if progress:
+            self.job_store.update(uuid, progress=dict(progress))
+
+
+class Worker:
+    """Claim jobs from the shared job store and run up to slots of them at a time"""
+
+    def __init__(self, job_store, slots=None, lease_seconds=None, max_attempts=None, poll_seconds=None, worker_id=None):
+        self.job_store = job_store
+        self.slots = slots or int(os.getenv("JOB_WORKERS", "2"))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "30"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.poll_seconds = poll_seconds or float(os.getenv("WORKER_POLL_SECONDS", "1"))
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.runner = JobRunner(job_store, events=StoreProgress(job_store))
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self):
+        print(f"Worker {self.worker_id} started with {self.slots} slots")
+        threading.Thread(target=self._heartbeat, name="heartbeat", daemon=True).start()
+        with ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="job") as pool:
+            while not self._stopping.is_set():
+                self._reclaim()
+                metadata = None
+                with self._lock:
+                    free = len(self._running) < self.slots
+                if free:
+                    metadata = self.job_store.claim(self.worker_id, self.lease_seconds)
+                if metadata is None:
+                    self._stopping.wait(self.poll_seconds)
+                    continue
+                with self._lock:
+                    self._running.add(metadata["uuid"])
+                print(f"Claimed job {metadata['uuid']} (attempt {metadata['attempts']})")
+                pool.submit(self._run_job, metadata)
+            self._requeue_running()
+
+    def stop(self):
+        self._stopping.set()
+
+    def serve_metrics(self, port):
+        """Serve /metrics in the Prometheus text format from a background thread"""
+        worker = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                with worker._lock:
+                    running = len(worker._running)
+                telemetry.set_gauge("mcq_worker_jobs_running", running)
+                body = telemetry.registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # One line per scrape would drown the job logs
+
+        server = ThreadingHTTPServer(("", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Metrics on port {port}")
+        return server
+
+    def _run_job(self, metadata):
+        uuid = metadata["uuid"]
+        try:
+            self.runner.run(metadata)
+        except Exception as e:
+            print(f"❌ Job {uuid} failed: {e}")
+            self.job_store.transition(uuid, "Processing", f"Error: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(uuid)
+            if not self._stopping.is_set():
+                self.job_store.release_lease(uuid, self.worker_id)
+
+    def _reclaim(self):
+        requeued, failed = self.job_store.reclaim_expired(self.max_attempts)
+        if requeued or failed:
+            print(f"Reclaimed jobs of lost workers: {len(requeued)} queued again, {len(failed)} failed")
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            with self._lock:
+                running = set(self._running)
+            try:
+                held = self.job_store.renew_leases(self.worker_id, running, self.lease_seconds)
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+                continue
+            for uuid in running - held:
+                metadata = self.job_store.get(uuid)
+                if metadata is None:
+                    continue
+                if metadata["status"] == "Cancelled":
+                    self.runner.cancel(uuid)
+                elif metadata["status"] == "Queued" or (metadata["status"] == "Processing" and metadata.get("worker") != self.worker_id):
+                    # Reclaimed while this worker couldn't renew, it is queued again or another worker runs it
+                    self.runner.abandon(uuid)
+                # Any other status: the job has just finished, its runner is wrapping up
+
+    def _requeue_running(self):
+        """On shutdown, hand the running jobs back to the queue instead of waiting for their leases to run out"""
+        with self._lock:
+            running = set(self._running)
+        for uuid in running:
+            self.runner.abandon(uuid)
+            self.job_store.release_lease(uuid, self.worker_id, requeue=True)
+        if running:
+            print(f"Queued {len(running)} running jobs again")
+
+
+def main():
+    from dotenv import load_dotenv
+    from job_store import create_job_store
+    from storage import ensure_directories
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=None, help="jobs run at the same time (JOB_WORKERS)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="port of /metrics (WORKER_METRICS_PORT), 0 turns it off")
+    args = parser.parse_args()
+
+    load_dotenv()
+    ensure_directories()
+    worker = Worker(create_job_store(), slots=args.slots)
+    metrics_port = args.metrics_port if args.metrics_port is not None else int(os.getenv("WORKER_METRICS_PORT", "9101"))
+    if metrics_port:
+        try:
+            worker.serve_metrics(metrics_port)
+        except OSError as e:
+            # e.g. a second worker on the same host, give each one its own --metrics-port
+            print(f"Metrics not served, port {metrics_port}: {e}")
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()